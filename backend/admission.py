@@ -0,0 +1,117 @@
+import json
+import threading
+
+# ---------------------------
+# Admission control
+# ---------------------------
+# WSGI middleware that caps in-flight requests per process. A request waits
+# up to ADMISSION_QUEUE_TIMEOUT seconds for a slot and is otherwise shed with
+# 503 + Retry-After, so overload shows up as fast retries instead of a
+# growing backlog of requests stuck behind SQLite locks or SMTP.
+# SSE streams hold a server thread for as long as the page is open, so they
+# get their own per-process cap (ADMISSION_MAX_STREAMS) and are refused
+# straight away once it is reached; the page then falls back to refetching.
+
+SHED_BODY = json.dumps({"category": "danger", "message": "Server busy, please retry shortly"}).encode('utf-8')
+
+
+class _ReleasingIterable:
+    # the slot is held until the body has been fully sent
+    def __init__(self, iterable, release):
+        self._iterable = iterable
+        self._release = release
+
+    def __iter__(self):
+        # servers call close(), but not every caller does (e.g. test clients)
+        try:
+            yield from self._iterable
+        finally:
+            self._release()
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            self._release()
+
+
+class AdmissionControl:
+    def __init__(self, wsgi_app, max_concurrent, queue_timeout, exempt_prefixes=(),
+                 stream_prefixes=(), max_streams=4, retry_after=1):
+        self.wsgi_app = wsgi_app
+        self.queue_timeout = queue_timeout
+        self.exempt_prefixes = tuple(exempt_prefixes)
+        self.stream_prefixes = tuple(stream_prefixes)
+        self.retry_after = str(retry_after)
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._streams = threading.BoundedSemaphore(max_streams)
+
+    def _shed(self, start_response):
+        start_response('503 Service Unavailable', [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(SHED_BODY))),
+            ('Retry-After', self.retry_after),
+        ])
+        return [SHED_BODY]
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(self.exempt_prefixes):
+            return self.wsgi_app(environ, start_response)
+
+        if self.stream_prefixes and path.startswith(self.stream_prefixes):
+            # a stream never frees its slot on its own, so don't queue for one
+            slots, acquired = self._streams, self._streams.acquire(blocking=False)
+        else:
+            slots, acquired = self._slots, self._slots.acquire(timeout=self.queue_timeout)
+        if not acquired:
+            return self._shed(start_response)
+
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                slots.release()
+
+        try:
+            result = self.wsgi_app(environ, start_response)
+        except BaseException:
+            release()
+            raise
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(result, file_wrapper):
+            # file bodies go out via sendfile; keep the server's wrapper visible
+            release()
+            return result
+        return _ReleasingIterable(result, release)
+
+
+def default_limits(worker_class='gthread', threads=8, worker_connections=1000):
+    # (max_concurrent, max_streams) for a gunicorn worker. Under gthread the
+    # caps have to stay below the thread count, or a request never waits for
+    # a slot and nothing is ever shed: half the threads serve requests, a
+    # quarter may hold SSE streams, and the rest are where an overload queues
+    # until ADMISSION_QUEUE_TIMEOUT. Under gevent connections are cheap but
+    # SQLite calls are not, so only a tenth of them run at once.
+    if worker_class == 'gevent':
+        return max(worker_connections // 10, 1), max(worker_connections // 2, 1)
+    return max(threads // 2, 1), max(threads // 4, 1)
+
+
+def init_admission(app):
+    max_concurrent, max_streams = default_limits()
+    app.config.setdefault('ADMISSION_MAX_CONCURRENT', max_concurrent)
+    app.config.setdefault('ADMISSION_QUEUE_TIMEOUT', 2.0)
+    app.config.setdefault('ADMISSION_EXEMPT_PREFIXES', ('/assets/',))
+    app.config.setdefault('ADMISSION_STREAM_PREFIXES', ('/changes/stream',))
+    app.config.setdefault('ADMISSION_MAX_STREAMS', max_streams)
+    app.wsgi_app = AdmissionControl(
+        app.wsgi_app,
+        app.config['ADMISSION_MAX_CONCURRENT'],
+        app.config['ADMISSION_QUEUE_TIMEOUT'],
+        app.config['ADMISSION_EXEMPT_PREFIXES'],
+        app.config['ADMISSION_STREAM_PREFIXES'],
+        app.config['ADMISSION_MAX_STREAMS'],
+    )
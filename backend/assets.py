@@ -0,0 +1,240 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import mimetypes
+import click
+from flask import request, send_file, abort
+from compression import negotiate
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ---------------------------
+# Static asset pipeline
+# ---------------------------
+# `flask --app new build-assets` copies frontend/ into frontend/dist/ with
+# content-hashed file names, .gz/.br siblings for text assets, resized/WebP
+# image variants and a manifest.json. The /assets/ route then serves those
+# files with immutable caching (images honour ?w=<px> for srcset, picking the
+# smallest variant at least that wide); index() renders dist/index.html when
+# present.
+
+FRONTEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend'))
+DIST_DIR = os.path.join(FRONTEND_DIR, 'dist')
+MANIFEST_NAME = 'manifest.json'
+ASSETS_URL = '/assets'
+
+TEXT_EXTS = ('.js', '.css', '.svg', '.json')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+IMAGE_WIDTHS = (480, 960)
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+IMPORT_RE = re.compile(r'''((?:import|from)\s*["'])(\.{1,2}/[^"']+)(["'])''')
+STATIC_REF_RE = re.compile(r'''/static/([\w./-]+\.\w+)''')
+URL_FOR_RE = re.compile(r'''\{\{\s*url_for\(\s*'static'\s*,\s*filename\s*=\s*'([^']+)'\s*\)\s*\}\}''')
+
+
+def _hashed_name(rel, data):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    root, ext = os.path.splitext(rel)
+    return f"{root}.{digest}{ext}"
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _write_compressed(path, data):
+    # mtime=0 keeps the .gz output byte-identical between builds
+    _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(path + '.br', brotli.compress(data, quality=11))
+
+
+def _image_variants(src_path, hashed_rel, out_dir):
+    if Image is None:
+        return {}
+    variants = {}
+    root, ext = os.path.splitext(hashed_rel)
+    with Image.open(src_path) as img:
+        img = img.convert('RGB')
+        webp_rel = f"{root}.webp"
+        img.save(os.path.join(out_dir, webp_rel), 'WEBP', quality=80, method=6)
+        variants['webp'] = webp_rel
+        for width in IMAGE_WIDTHS:
+            if img.width <= width:
+                continue
+            resized = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+            fallback = 'PNG' if ext.lower() == '.png' else 'JPEG'
+            for fmt, suffix in ((fallback, ext), ('WEBP', '.webp')):
+                rel = f"{root}.w{width}{suffix}"
+                resized.save(os.path.join(out_dir, rel), fmt, quality=80, optimize=True)
+                variants[f"{width}{suffix}"] = rel
+    return variants
+
+
+def build_assets(src_dir=FRONTEND_DIR, out_dir=DIST_DIR):
+    sources = []
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != out_dir]
+        for name in files:
+            rel = os.path.relpath(os.path.join(root, name), src_dir).replace(os.sep, '/')
+            if rel.endswith(TEXT_EXTS + IMAGE_EXTS):
+                sources.append(rel)
+
+    manifest = {}
+    variants = {}
+
+    def process(rel, stack=()):
+        if rel in manifest:
+            return manifest[rel]
+        if rel in stack:
+            raise ValueError(f"circular import: {' -> '.join(stack + (rel,))}")
+        src_path = os.path.join(src_dir, rel)
+        with open(src_path, 'rb') as f:
+            data = f.read()
+
+        if rel.endswith(TEXT_EXTS):
+            text = data.decode('utf-8')
+            base = os.path.dirname(rel)
+
+            # relative ES module imports must point at the hashed file, so
+            # dependencies are hashed first and their names fed into ours
+            def rewrite_import(m):
+                dep = os.path.normpath(os.path.join(base, m.group(2))).replace(os.sep, '/')
+                if dep not in sources:
+                    return m.group(0)
+                target = os.path.relpath(process(dep, stack + (rel,)), base or '.').replace(os.sep, '/')
+                if not target.startswith('.'):
+                    target = './' + target
+                return m.group(1) + target + m.group(3)
+
+            def rewrite_static(m):
+                dep = m.group(1)
+                if dep not in sources:
+                    return m.group(0)
+                return f"{ASSETS_URL}/{process(dep, stack + (rel,))}"
+
+            text = IMPORT_RE.sub(rewrite_import, text)
+            text = STATIC_REF_RE.sub(rewrite_static, text)
+            data = text.encode('utf-8')
+
+        hashed = _hashed_name(rel, data)
+        out_path = os.path.join(out_dir, hashed)
+        _write(out_path, data)
+        if rel.endswith(TEXT_EXTS):
+            _write_compressed(out_path, data)
+        elif rel.endswith(IMAGE_EXTS):
+            found = _image_variants(src_path, hashed, out_dir)
+            if found:
+                variants[hashed] = found
+        manifest[rel] = hashed
+        return hashed
+
+    for rel in sources:
+        process(rel)
+
+    index_src = os.path.join(src_dir, 'index.html')
+    if os.path.exists(index_src):
+        with open(index_src, encoding='utf-8') as f:
+            html = f.read()
+
+        def rewrite_url_for(m):
+            hashed = manifest.get(m.group(1))
+            return f"{ASSETS_URL}/{hashed}" if hashed else m.group(0)
+
+        html = URL_FOR_RE.sub(rewrite_url_for, html)
+        with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
+            f.write(html)
+
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w') as f:
+        json.dump({"assets": manifest, "variants": variants}, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(out_dir=DIST_DIR):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ---------------------------
+# Serving
+# ---------------------------
+PRECOMPRESSED = {'br': '.br', 'gzip': '.gz'}
+
+
+def _pick_encoding(path, accept_encoding):
+    # same q-value negotiation as dynamic responses, over the copies on disk
+    on_disk = [encoding for encoding, suffix in PRECOMPRESSED.items() if os.path.exists(path + suffix)]
+    encoding = negotiate(accept_encoding, on_disk)
+    if encoding is None:
+        return path, None
+    return path + PRECOMPRESSED[encoding], encoding
+
+
+def serve_asset(filename, out_dir=DIST_DIR, manifest=None):
+    path = os.path.abspath(os.path.join(out_dir, filename))
+    if not path.startswith(out_dir + os.sep) or not os.path.isfile(path):
+        abort(404)
+
+    vary = ['Accept-Encoding']
+    variants = (manifest or {}).get('variants', {}).get(filename)
+    if variants:
+        # ?w= picks the smallest resized copy that is wide enough, and WebP
+        # goes to browsers that accept it
+        vary.append('Accept')
+        webp = 'image/webp' in request.headers.get('Accept', '')
+        suffix = '.webp' if webp else os.path.splitext(filename)[1]
+        wanted = request.args.get('w', type=int)
+        width = next((w for w in IMAGE_WIDTHS if wanted and w >= wanted and f"{w}{suffix}" in variants), None)
+        if width:
+            path = os.path.join(out_dir, variants[f"{width}{suffix}"])
+        elif webp:
+            path = os.path.join(out_dir, variants['webp'])
+
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    file_path, encoding = _pick_encoding(path, request.headers.get('Accept-Encoding', ''))
+
+    # send_file hands the open file to wsgi.file_wrapper, or answers with an
+    # X-Sendfile header when USE_X_SENDFILE is on, so Python never copies it
+    response = send_file(file_path, mimetype=mimetype, download_name=os.path.basename(path),
+                         conditional=True, etag=True, max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE
+    response.headers['Vary'] = ', '.join(vary)
+    return response
+
+
+def init_assets(app, out_dir=DIST_DIR):
+    app.config.setdefault('USE_X_SENDFILE', os.environ.get('USE_X_SENDFILE') == '1')
+    state = {"manifest": load_manifest(out_dir)}
+
+    @app.route(f"{ASSETS_URL}/<path:filename>", methods=['GET'])
+    def assets(filename):
+        return serve_asset(filename, out_dir, state["manifest"])
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        manifest = build_assets(out_dir=out_dir)
+        state["manifest"] = load_manifest(out_dir)
+        click.echo(f"built {len(manifest)} assets into {out_dir}")
+
+    def asset_template():
+        return 'dist/index.html' if state["manifest"] and os.path.exists(os.path.join(out_dir, 'index.html')) else 'index.html'
+
+    return asset_template
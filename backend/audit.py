@@ -0,0 +1,253 @@
+import os
+import json
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime as DateTime
+from flask import has_request_context, request
+from flask_jwt_extended import get_jwt
+from celery.signals import worker_process_shutdown
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import db, AuditLog, User, DoctorProfile, PatientProfile, Department, Appointment, Treatment
+from tenants import current_tenant, tenant_engine
+
+# ---------------------------
+# Audit log
+# ---------------------------
+# after_flush records who changed what (only the changed columns, before and
+# after) in session.info; after_commit hands those entries to an in-process
+# buffer and a rollback drops them. A background thread writes the buffer out
+# in batches every AUDIT_FLUSH_INTERVAL seconds or AUDIT_BATCH_SIZE entries,
+# so a request only pays for building a few dicts. Whatever is still buffered
+# at exit is written synchronously, and spilled to a JSONL segment if the
+# database can't take it.
+
+AUDITED = {
+    User: 'user',
+    DoctorProfile: 'doctor_profile',
+    PatientProfile: 'patient_profile',
+    Department: 'department',
+    Appointment: 'appointment',
+    Treatment: 'treatment',
+}
+REDACTED = ('password',)
+
+log = logging.getLogger(__name__)
+
+
+def _value(key, value):
+    return '[redacted]' if key in REDACTED and value is not None else value
+
+
+def _snapshot(state):
+    return {prop.key: _value(prop.key, state.dict.get(prop.key)) for prop in state.mapper.column_attrs}
+
+
+def _diff(state):
+    before, after = {}, {}
+    for prop in state.mapper.column_attrs:
+        history = state.attrs[prop.key].history
+        if history.has_changes():
+            before[prop.key] = _value(prop.key, history.deleted[0] if history.deleted else None)
+            after[prop.key] = _value(prop.key, history.added[0] if history.added else None)
+    return before, after
+
+
+def _actor():
+    if not has_request_context():
+        return None, 'system', None, None
+    try:
+        claims = get_jwt()
+    except RuntimeError:
+        # public routes (register, login) have no verified token
+        claims = {}
+    return (claims.get('user_id') or claims.get('admin_user_id'), claims.get('role'),
+            f"{request.method} {request.path}"[:120], request.remote_addr)
+
+
+def _record_audit(session, flush_context):
+    changes = [(obj, 'insert') for obj in session.new]
+    changes += [(obj, 'update') for obj in session.dirty]
+    changes += [(obj, 'delete') for obj in session.deleted]
+
+    actor = None
+    for obj, action in changes:
+        entity = AUDITED.get(type(obj))
+        if entity is None:
+            continue
+        state = inspect(obj)
+        if action == 'update':
+            before, after = _diff(state)
+            if not after:
+                continue
+        elif action == 'insert':
+            before, after = None, _snapshot(state)
+        else:
+            before, after = _snapshot(state), None
+        if actor is None:
+            actor = _actor()
+        session.info.setdefault('audit_pending', []).append({
+            "tenant": current_tenant(),
+            "actor_id": actor[0],
+            "actor_role": actor[1],
+            "entity": entity,
+            "entity_id": state.mapper.primary_key_from_instance(obj)[0],
+            "action": action,
+            "before": before,
+            "after": after,
+            "endpoint": actor[2],
+            "ip": actor[3],
+            "created_at": DateTime.now(),
+        })
+
+
+def _buffer_committed(session):
+    pending = session.info.pop('audit_pending', None)
+    if pending and writer is not None:
+        writer.append(pending)
+
+
+def _discard_pending(session, previous_transaction):
+    session.info.pop('audit_pending', None)
+
+
+# ---------------------------
+# Sinks
+# ---------------------------
+def _encode(value):
+    return json.dumps(value, default=str) if value is not None else None
+
+
+class DatabaseSink:
+    # one executemany per hospital database per batch
+    def __init__(self, app):
+        self.app = app
+
+    def write(self, entries):
+        by_tenant = {}
+        for entry in entries:
+            row = dict(entry, before=_encode(entry['before']), after=_encode(entry['after']))
+            by_tenant.setdefault(row.pop('tenant'), []).append(row)
+        with self.app.app_context():
+            for tenant, rows in by_tenant.items():
+                with tenant_engine(db, tenant).begin() as conn:
+                    conn.execute(AuditLog.__table__.insert(), rows)
+
+
+class JsonlSink:
+    # append-only segments: audit-<timestamp>-<pid>.jsonl, rotated by size
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._file = None
+
+    def _segment(self):
+        if self._file is not None and self._file.tell() >= self.segment_bytes:
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"audit-{DateTime.now().strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}.jsonl"
+            self._file = open(os.path.join(self.directory, name), 'a', encoding='utf-8')
+        return self._file
+
+    def write(self, entries):
+        f = self._segment()
+        f.write(''.join(json.dumps(entry, default=str) + '\n' for entry in entries))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# ---------------------------
+# Buffered writer
+# ---------------------------
+class AuditWriter:
+    def __init__(self, sink, batch_size=500, interval=1.0, spill=None):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.spill = spill
+        self._entries = deque()
+        self._ready = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+    def append(self, entries):
+        with self._ready:
+            self._entries.extend(entries)
+            if len(self._entries) >= self.batch_size:
+                self._ready.notify()
+        if self._pid != os.getpid():
+            self._start()
+
+    def _start(self):
+        # (re)started lazily so forked workers each get their own flusher
+        with self._flush_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            with self._ready:
+                if len(self._entries) < self.batch_size:
+                    self._ready.wait(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            while self._entries:
+                batch = [self._entries.popleft() for _ in range(min(self.batch_size, len(self._entries)))]
+                try:
+                    self.sink.write(batch)
+                except Exception:
+                    # keep the batch (in order) and retry on the next tick
+                    self._entries.extendleft(reversed(batch))
+                    log.exception("audit flush failed; %d entries buffered", len(self._entries))
+                    return False
+        return True
+
+    def close(self):
+        self._closed = True
+        with self._ready:
+            self._ready.notify()
+        if self.flush() or self.spill is None:
+            return
+        with self._flush_lock:
+            entries = list(self._entries)
+            self.spill.write(entries)
+            self._entries.clear()
+            log.warning("audit: spilled %d entries to %s", len(entries), self.spill.directory)
+
+
+writer = None
+
+
+def init_audit(app):
+    global writer
+    app.config.setdefault('AUDIT_SINK', 'database')  # or 'jsonl'
+    app.config.setdefault('AUDIT_DIR', os.path.join(app.instance_path, 'audit'))
+    app.config.setdefault('AUDIT_BATCH_SIZE', 500)
+    app.config.setdefault('AUDIT_FLUSH_INTERVAL', 1.0)
+    app.config.setdefault('AUDIT_SEGMENT_BYTES', 16 * 1024 * 1024)
+
+    segments = JsonlSink(app.config['AUDIT_DIR'], app.config['AUDIT_SEGMENT_BYTES'])
+    if app.config['AUDIT_SINK'] == 'jsonl':
+        sink, spill = segments, None
+    else:
+        sink, spill = DatabaseSink(app), segments
+    writer = AuditWriter(sink, app.config['AUDIT_BATCH_SIZE'], app.config['AUDIT_FLUSH_INTERVAL'], spill)
+
+    event.listen(Session, 'after_flush', _record_audit)
+    event.listen(Session, 'after_commit', _buffer_committed)
+    event.listen(Session, 'after_soft_rollback', _discard_pending)
+    atexit.register(writer.close)
+    # prefork Celery children exit without running atexit hooks
+    worker_process_shutdown.connect(lambda **kwargs: writer.close(), weak=False)
+    return writer
@@ -0,0 +1,135 @@
+"""Utilization matrix computation over several years of appointments.
+
+    python bench_analytics.py [--years 3] [--per-day 400] [--doctors 200] [--departments 20]
+
+Uses a throwaway SQLite file and only the models and analytics.py, not new.py.
+It fills the appointments table with `years` of history (about per-day
+bookings a day, weighted toward late mornings), then times:
+  - compute_utilization over the whole window, split into the history query,
+    the numpy aggregation and the matrix write,
+  - the same aggregation done row by row in Python, as a baseline,
+  - recommend_slots for one department, as the endpoint calls it.
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from itertools import chain
+from collections import Counter
+from datetime import datetime as DateTime, time as Time, timedelta
+import numpy as np
+from flask import Flask
+
+from models import db, User, DoctorProfile, Department, Appointment, UtilizationMatrix
+import analytics
+
+HOUR_WEIGHTS = {9: 3, 10: 5, 11: 5, 12: 3, 13: 1, 14: 2, 15: 2, 16: 1}
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    db.init_app(app)
+    return app
+
+
+def seed(doctors, departments, years, per_day, now):
+    db.session.execute(Department.__table__.insert(), [
+        {"id": d, "name": f"Department {d}"} for d in range(1, departments + 1)])
+    db.session.execute(User.__table__.insert(), [
+        {"id": u, "username": f"doctor{u}@bench", "password": 'x', "role": 'doctor', "approve": True, "blocked": False}
+        for u in range(1, doctors + 1)])
+    db.session.execute(DoctorProfile.__table__.insert(), [
+        {"user_id": u, "specialization_id": 1 + u % departments} for u in range(1, doctors + 1)])
+
+    rng = random.Random(1)
+    hours, weights = list(HOUR_WEIGHTS), list(HOUR_WEIGHTS.values())
+    # a few popular doctors take a large share of the bookings
+    doctor_weights = [5 if u % 10 == 0 else 1 for u in range(1, doctors + 1)]
+    start = now.date() - timedelta(days=365 * years)
+    total, batch = 0, []
+    for day in range(365 * years):
+        date = start + timedelta(days=day)
+        if date.weekday() == 6:
+            continue
+        for doctor_id in rng.choices(range(1, doctors + 1), doctor_weights, k=per_day):
+            batch.append({"patient_id": doctors + 1, "doctor_id": doctor_id, "department_id": 1 + doctor_id % departments,
+                          "date": date, "time": Time(rng.choices(hours, weights)[0], rng.choice((0, 15, 30, 45))),
+                          "status": rng.choice(('Completed', 'Completed', 'Completed', 'Cancelled'))})
+        if len(batch) >= 50000:
+            db.session.execute(Appointment.__table__.insert(), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(Appointment.__table__.insert(), batch)
+        total += len(batch)
+    db.session.commit()
+    return total
+
+
+def python_matrices(rows):
+    doctor, department = Counter(), Counter()
+    for doctor_id, department_id, weekday, hour in rows:
+        cell = ((weekday + 6) % 7) * 24 + hour
+        doctor[doctor_id, cell] += 1
+        department[department_id, cell] += 1
+    return doctor, department
+
+
+def timed(fn, *args, **kwargs):
+    began = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--per-day', type=int, default=400)
+    parser.add_argument('--doctors', type=int, default=200)
+    parser.add_argument('--departments', type=int, default=20)
+    args = parser.parse_args()
+    now = DateTime.now()
+    weeks = 52 * args.years + 1
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = make_app(path)
+    with app.app_context():
+        db.create_all()
+        appointments, seeded = timed(seed, args.doctors, args.departments, args.years, args.per_day, now)
+        print(f"{appointments} appointments over {args.years} years, {args.doctors} doctors "
+              f"(seeded in {seeded:.1f}s)")
+
+        stored, total = timed(analytics.compute_utilization, db.session, weeks=weeks, now=now)
+        print(f"compute_utilization: {stored} matrices in {total * 1000:.0f} ms")
+
+        since = str((now - timedelta(weeks=weeks)).date())
+        rows, query = timed(lambda: db.session.execute(analytics.HISTORY_SQL, {"since": since}).all())
+        data = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 4)
+        cells = ((data[:, 2] + 6) % 7) * 24 + data[:, 3]
+        _, vectorized = timed(lambda: [analytics._matrices(data[:, column], cells) for column in (0, 1)])
+        _, looped = timed(python_matrices, rows)
+        blob = db.session.query(UtilizationMatrix).first().counts
+        print(f"  history query    {query * 1000:8.0f} ms  ({len(rows)} rows)")
+        print(f"  numpy bincount   {vectorized * 1000:8.1f} ms")
+        print(f"  conversion+write {max(total - query - vectorized, 0) * 1000:8.0f} ms")
+        print(f"  python Counter   {looped * 1000:8.1f} ms  (baseline for the aggregation step, "
+              f"{looped / max(vectorized, 1e-9):.0f}x slower)")
+        print(f"  storage          {len(blob)} bytes per matrix, {stored * len(blob) / 1024:.0f} KiB total")
+
+        samples = []
+        for department_id in range(1, args.departments + 1):
+            _, spent = timed(analytics.recommend_slots, db.session, department_id, days=7, limit=10, now=now)
+            samples.append(spent)
+        samples.sort()
+        print(f"recommend_slots (7 days, {args.doctors // args.departments} doctors/department): "
+              f"median {samples[len(samples) // 2] * 1000:.1f} ms, max {samples[-1] * 1000:.1f} ms")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
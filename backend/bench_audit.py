@@ -0,0 +1,153 @@
+"""Per-request cost of the audit hooks.
+
+    python bench_audit.py [--requests 2000] [--rounds 3] [--sink database|jsonl]
+
+Uses a throwaway SQLite file and only the models and audit.py, not new.py.
+Each request is the write path of doctor_complete_appointment: a verified
+doctor token, an appointment marked Completed and a Treatment inserted, then
+one commit. Rounds alternate between a baseline commit with no audit
+listeners and the same commit with _record_audit / _buffer_committed
+registered and the AuditWriter flushing in the background. It prints the
+request latency for both, the time spent inside the two hooks, and how long
+the writer takes to drain what was buffered.
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import date as Date, time as Time
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token, verify_jwt_in_request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, User, Appointment, Treatment, AuditLog
+import audit
+
+hook_time = [0.0]
+
+
+def timed(hook):
+    def run(*args):
+        began = time.perf_counter()
+        try:
+            hook(*args)
+        finally:
+            hook_time[0] += time.perf_counter() - began
+    return run
+
+
+record_audit = timed(audit._record_audit)
+buffer_committed = timed(audit._buffer_committed)
+discard_pending = timed(audit._discard_pending)
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    app.config['JWT_SECRET_KEY'] = 'bench-secret-' * 4
+    db.init_app(app)
+    JWTManager(app)
+    return app
+
+
+def hooks(enabled):
+    for name, hook in (('after_flush', record_audit), ('after_commit', buffer_committed),
+                       ('after_soft_rollback', discard_pending)):
+        if enabled:
+            event.listen(Session, name, hook)
+        else:
+            event.remove(Session, name, hook)
+
+
+def seed(n):
+    doctor = User(username='doctor@bench', password='x', role='doctor', approve=True)
+    patient = User(username='patient@bench', password='x', role='patient', approve=True)
+    db.session.add_all([doctor, patient])
+    db.session.flush()
+    db.session.add_all(Appointment(patient_id=patient.id, doctor_id=doctor.id, date=Date(2026, 1, 1 + i % 28),
+                                   time=Time(9 + i % 8), status='Booked') for i in range(n))
+    db.session.commit()
+    return doctor.id
+
+
+def run_requests(app, token, ids):
+    latencies = []
+    for appointment_id in ids:
+        with app.test_request_context(f"/doctor/appointment/{appointment_id}/complete", method='POST',
+                                      headers={"Authorization": f"Bearer {token}"}):
+            began = time.perf_counter()
+            verify_jwt_in_request()
+            appt = db.session.get(Appointment, appointment_id)
+            appt.status = 'Completed'
+            appt.remarks = 'seen'
+            db.session.add(Treatment(appointment_id=appt.id, diagnosis='flu', prescription='rest', notes='bench'))
+            db.session.commit()
+            latencies.append(time.perf_counter() - began)
+            db.session.remove()
+    return latencies
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--sink', choices=('database', 'jsonl'), default='database')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    segments = tempfile.mkdtemp()
+    app = make_app(path)
+    with app.app_context():
+        db.create_all()
+        doctor_id = seed(args.requests * args.rounds * 2)
+        token = create_access_token(identity=str(doctor_id), additional_claims={"role": "doctor", "user_id": doctor_id})
+    sink = audit.DatabaseSink(app) if args.sink == 'database' else audit.JsonlSink(segments)
+    audit.writer = audit.AuditWriter(sink)
+
+    results = {False: [], True: []}
+    next_id = 1
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            if enabled:
+                hooks(True)
+            with app.app_context():
+                results[enabled] += run_requests(app, token, range(next_id, next_id + args.requests))
+            next_id += args.requests
+            if enabled:
+                hooks(False)
+
+    began = time.perf_counter()
+    audit.writer.close()
+    drained = time.perf_counter() - began
+    with app.app_context():
+        written = AuditLog.query.count() if args.sink == 'database' else sum(
+            sum(1 for _ in open(os.path.join(segments, name))) for name in os.listdir(segments))
+
+    total = args.requests * args.rounds
+    print(f"{total} requests per mode, {args.rounds} alternating rounds, sink={args.sink}")
+    print(f"  {'mode':<10}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}")
+    for label, enabled in (('baseline', False), ('audited', True)):
+        values = results[enabled]
+        print(f"  {label:<10}{sum(values) / len(values) * 1e6:>10.1f}{percentile(values, .5) * 1e6:>10.1f}"
+              f"{percentile(values, .95) * 1e6:>10.1f}")
+    overhead = (sum(results[True]) - sum(results[False])) / total
+    print(f"  overhead per request      {overhead * 1e6:8.1f} us")
+    print(f"  inside the hooks          {hook_time[0] / total * 1e6:8.1f} us")
+    print(f"audit rows written: {written} (expected {total * 2}); close() drained the rest in {drained * 1000:.1f} ms")
+
+    shutil.rmtree(segments, ignore_errors=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
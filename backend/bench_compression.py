@@ -0,0 +1,135 @@
+"""Bytes on the wire and latency of compressed JSON over a slow link.
+
+    python bench_compression.py [--requests 200] [--mbps 2] [--rtt-ms 150]
+
+Uses a minimal Flask app with init_compression, not new.py. It serves
+/patient/treatments-style lists of synthetic rows (diagnosis, prescription
+and notes text) from 20 to 2000 rows. Each available encoding gets the same
+random mix of list sizes, first with a fresh body on every request, so the
+LRU always misses, and then with repeats that hit it. Latency is modelled as
+server time + RTT + wire bytes over the given bandwidth, with a
+hospital-Wi-Fi-like link by default. The script prints mean wire bytes and
+p50/p95 latency per encoding, the streamed (chunked) size, and the size of a
+304 revalidation.
+"""
+import json
+import time
+import random
+import argparse
+from flask import Flask, Response, jsonify, request
+
+from compression import init_compression, available_encodings
+
+payloads = {}
+
+WORDS = ('fever cough fatigue mild moderate severe persistent acute chronic review '
+         'tablet capsule twice daily after meals for days paracetamol amoxicillin '
+         'ibuprofen rest fluids follow up blood pressure normal elevated advised').split()
+
+
+def text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def rows(count, seed):
+    rng = random.Random(seed)
+    return [{
+        "id": i,
+        "appointment_id": 1000 + i,
+        "doctor": f"Dr. {rng.choice(('Rao', 'Iyer', 'Khan', 'Das', 'Mehta'))}",
+        "date": f"2026-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+        "diagnosis": text(rng, 8),
+        "prescription": text(rng, 14),
+        "notes": text(rng, 30),
+    } for i in range(count)]
+
+
+def payload():
+    key = (int(request.args['rows']), int(request.args['seed']))
+    if key not in payloads:
+        payloads[key] = rows(*key)
+    return payloads[key]
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config['COMPRESS_MIN_SIZE'] = 1024
+
+    @app.get('/treatments')
+    def treatments():
+        return jsonify(payload())
+
+    @app.get('/treatments/stream')
+    def treatments_stream():
+        data = payload()
+
+        def generate():
+            yield '['
+            for i, row in enumerate(data):
+                yield (',' if i else '') + json.dumps(row)
+            yield ']'
+        return Response(generate(), mimetype='application/json')
+
+    init_compression(app)
+    return app
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--mbps', type=float, default=2.0)
+    parser.add_argument('--rtt-ms', type=float, default=150.0)
+    args = parser.parse_args()
+    bytes_per_second = args.mbps * 1e6 / 8
+    rtt = args.rtt_ms / 1000
+
+    rng = random.Random(1)
+    sizes = [rng.choice((20, 50, 100, 200, 500, 1000, 2000)) for _ in range(args.requests)]
+    encodings = ['identity'] + list(available_encodings())
+    app = make_app()
+    client = app.test_client()
+
+    print(f"{args.requests} requests of 20-2000 rows, link {args.mbps} Mbit/s, RTT {args.rtt_ms:.0f} ms")
+    print(f"  {'encoding':<10}{'pass':<6}{'mean bytes':>12}{'ratio':>8}{'server ms':>11}{'p50 ms':>9}{'p95 ms':>9}")
+    identity_bytes = None
+    for e, encoding in enumerate(encodings):
+        for label, fresh in (('miss', True), ('hit', False)):
+            # a fresh seed changes the body (new ETag); a repeated one hits the LRU
+            seeds = [1 + e * args.requests + i if fresh else 0 for i in range(len(sizes))]
+            for count, seed in zip(sizes, seeds):
+                payloads.setdefault((count, seed), rows(count, seed))
+            wire, server, latency = [], [], []
+            for count, seed in zip(sizes, seeds):
+                began = time.perf_counter()
+                res = client.get(f'/treatments?rows={count}&seed={seed}', headers={'Accept-Encoding': encoding})
+                spent = time.perf_counter() - began
+                size = len(res.get_data())
+                wire.append(size)
+                server.append(spent)
+                latency.append(spent + rtt + size / bytes_per_second)
+            mean = sum(wire) / len(wire)
+            if identity_bytes is None:
+                identity_bytes = mean
+            print(f"  {encoding:<10}{label:<6}{mean:>12.0f}{identity_bytes / mean:>8.1f}"
+                  f"{sum(server) / len(server) * 1000:>11.2f}{percentile(latency, .5) * 1000:>9.0f}"
+                  f"{percentile(latency, .95) * 1000:>9.0f}")
+
+    print("streamed 2000 rows (chunked, compressed chunk by chunk):")
+    for encoding in encodings:
+        res = client.get('/treatments/stream?rows=2000&seed=7', headers={'Accept-Encoding': encoding})
+        print(f"  {encoding:<10}{len(res.get_data()):>10} bytes")
+
+    res = client.get('/treatments?rows=2000&seed=7', headers={'Accept-Encoding': 'gzip'})
+    again = client.get('/treatments?rows=2000&seed=7',
+                       headers={'Accept-Encoding': 'gzip', 'If-None-Match': res.headers['ETag']})
+    print(f"revalidation: {again.status_code} with {len(again.get_data())} body bytes "
+          f"(vs {len(res.get_data())} compressed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Queue latency under mixed load, without Redis.
+
+    python bench_queues.py [--seconds 5] [--notifications 300] [--exports 20] [--analytics 6]
+
+Runs the same queues, routes and WORKER_POOLS as new.py on kombu's in-memory
+transport. Tasks are stand-ins that sleep for a typical duration (a reminder
+batch send, a CSV export, a monthly report). The load is run twice: once
+against one shared pool on every queue, and once against one pool per queue
+sized by WORKER_POOLS. A pool of concurrency c is modelled as c solo workers
+with the pool's prefetch multiplier each, which reserves the same c * prefetch
+messages as a prefork worker. For each queue it prints how long tasks waited
+between publish and start.
+The memory transport has no priorities, so this measures queue separation
+only.
+"""
+import time
+import random
+import argparse
+import threading
+from celery import Celery
+
+import new
+
+DURATIONS = {
+    'tasks.send_reminder_batch': 0.02,
+    'tasks.export_treatments_csv': 0.3,
+    'tasks.monthly_activity_summary': 1.0,
+}
+
+waits = {}
+waits_lock = threading.Lock()
+
+
+def bench_name(name):
+    # new.py's tasks are shared with every app, so the stand-ins need their own names
+    return 'bench.' + name
+
+
+def make_app():
+    app = Celery('bench', broker='memory://', backend='cache+memory://')
+    app.conf.update(
+        task_queues=new.celery.conf.task_queues,
+        task_default_queue=new.celery.conf.task_default_queue,
+        task_routes={bench_name(name): new.celery.conf.task_routes[name] for name in DURATIONS},
+        worker_prefetch_multiplier=new.celery.conf.worker_prefetch_multiplier,
+        task_acks_late=True,
+        broker_transport_options={'polling_interval': 0.01},
+        worker_hijack_root_logger=False,
+    )
+    for name, duration in DURATIONS.items():
+        def run(published_at, _name=name, _duration=duration):
+            started = time.perf_counter()
+            with waits_lock:
+                waits.setdefault(new.celery.conf.task_routes[_name]['queue'], []).append(started - published_at)
+            time.sleep(_duration)
+        app.task(name=bench_name(name))(run)
+    return app
+
+
+def start_worker(queues, prefetch_multiplier):
+    # queue selection is per app, so every worker gets its own app instance
+    app = make_app()
+    worker = app.WorkController(
+        queues=queues, concurrency=1, prefetch_multiplier=prefetch_multiplier, pool='solo', loglevel='WARNING',
+        without_heartbeat=True, without_mingle=True, without_gossip=True,
+        hostname=f"bench-{'-'.join(queues)}-{random.random():.6f}",
+    )
+    threading.Thread(target=worker.start, daemon=True).start()
+    return worker
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_load(app, seconds, counts):
+    plan = [name for name, n in zip(DURATIONS, counts) for _ in range(n)]
+    random.shuffle(plan)
+    gap = seconds / max(len(plan), 1)
+    for name in plan:
+        app.send_task(bench_name(name), args=(time.perf_counter(),))
+        time.sleep(gap)
+    expected = len(plan)
+    deadline = time.time() + seconds + 120
+    while time.time() < deadline:
+        with waits_lock:
+            if sum(len(v) for v in waits.values()) >= expected:
+                return
+        time.sleep(0.05)
+
+
+def report(label, layout):
+    print(f"\n{label}")
+    for queues, concurrency, prefetch in layout:
+        print(f"  {','.join(queues)}: concurrency={concurrency} prefetch={prefetch}")
+    print(f"  {'queue':<14}{'tasks':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for queue, values in sorted(waits.items()):
+        print(f"  {queue:<14}{len(values):>6}{percentile(values, .5) * 1000:>10.1f}"
+              f"{percentile(values, .95) * 1000:>10.1f}{max(values) * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--notifications', type=int, default=300)
+    parser.add_argument('--exports', type=int, default=20)
+    parser.add_argument('--analytics', type=int, default=6)
+    args = parser.parse_args()
+    counts = (args.notifications, args.exports, args.analytics)
+    queues = [q.name for q in new.celery.conf.task_queues]
+
+    # the shared pool gets the same total concurrency as the dedicated ones
+    total = sum(pool['concurrency'] for pool in new.WORKER_POOLS.values())
+    layouts = [
+        ("one worker on all queues", [(queues, total, new.celery.conf.worker_prefetch_multiplier)]),
+        ("one worker per queue (WORKER_POOLS)", [
+            ([q], new.WORKER_POOLS[q]['concurrency'], new.WORKER_POOLS[q]['prefetch_multiplier']) for q in queues
+        ]),
+    ]
+    producer = make_app()
+    for label, layout in layouts:
+        waits.clear()
+        workers = [start_worker(q, prefetch) for q, concurrency, prefetch in layout for _ in range(concurrency)]
+        time.sleep(1)
+        run_load(producer, args.seconds, counts)
+        report(label, layout)
+        for w in workers:
+            w.stop(in_sighandler=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Reminder scheduling overhead at 100k appointments.
+
+    python bench_reminders.py [--appointments 100000] [--batch 1000]
+
+Uses a throwaway SQLite file and only the models and reminders.py, not new.py.
+It measures:
+  - booking through the ORM with and without the after_flush hook that keeps
+    the Reminder rows in sync (the per-appointment difference is the
+    scheduling overhead),
+  - rescheduling and cancelling 10% of them,
+  - backfill_reminders over appointments inserted without the hook,
+  - claim_due_reminders draining every reminder as the clock moves through
+    the days, plus the busiest minute (how evenly sends are spread).
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from collections import Counter
+from datetime import datetime as DateTime, date as Date, time as Time, timedelta
+from flask import Flask
+from sqlalchemy import event, delete, select, text
+from sqlalchemy.orm import Session
+
+from models import db, Appointment, Reminder
+import reminders
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    app.config['REMINDER_OFFSET_MINUTES'] = 120
+    db.init_app(app)
+    return app
+
+
+def random_slots(n, start, days):
+    # bookings spread over working hours, like patient_book_appointment produces
+    for _ in range(n):
+        day = start + timedelta(days=random.randrange(days))
+        yield day, Time(random.randrange(9, 17), random.choice((0, 15, 30, 45)))
+
+
+def book(n, batch, start, days):
+    began = time.perf_counter()
+    slots = random_slots(n, start, days)
+    for offset in range(0, n, batch):
+        for day, at in (next(slots) for _ in range(min(batch, n - offset))):
+            db.session.add(Appointment(patient_id=1, doctor_id=random.randrange(2, 200),
+                                       date=day, time=at, status='Booked'))
+        db.session.commit()
+    return time.perf_counter() - began
+
+
+def reset():
+    db.session.execute(delete(Reminder))
+    db.session.execute(delete(Appointment))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--appointments', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=90)
+    args = parser.parse_args()
+    n, start = args.appointments, Date.today() + timedelta(days=1)
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = make_app(path)
+    with app.app_context():
+        db.create_all()
+
+        plain = book(n, args.batch, start, args.days)
+        reset()
+        reminders.init_reminders(app)
+        hooked = book(n, args.batch, start, args.days)
+        scheduled = Reminder.query.count()
+        print(f"booking {n} appointments, batches of {args.batch}")
+        print(f"  without hook   {plain:8.2f}s  {plain / n * 1e6:8.1f} us/appt")
+        print(f"  with hook      {hooked:8.2f}s  {hooked / n * 1e6:8.1f} us/appt  ({scheduled} reminders)")
+        print(f"  overhead                   {(hooked - plain) / n * 1e6:8.1f} us/appt")
+
+        ids = [i for (i,) in db.session.execute(text("SELECT id FROM appointments ORDER BY random() LIMIT :k"),
+                                                {"k": n // 10})]
+        began = time.perf_counter()
+        for k, appt in enumerate(Appointment.query.filter(Appointment.id.in_(ids)).yield_per(args.batch)):
+            if k % 2:
+                appt.status = 'Cancelled'
+            else:
+                appt.date = appt.date + timedelta(days=1)
+        db.session.commit()
+        changed = time.perf_counter() - began
+        print(f"reschedule/cancel {len(ids)}: {changed:.2f}s  {changed / len(ids) * 1e6:.1f} us/appt")
+
+        # appointments imported before the scheduler existed
+        event.remove(Session, 'after_flush', reminders._sync_reminders)
+        db.session.execute(delete(Reminder))
+        db.session.commit()
+        began = time.perf_counter()
+        filled = reminders.backfill_reminders(db.session)
+        print(f"backfill_reminders: {filled} rows in {time.perf_counter() - began:.2f}s")
+
+        plan = db.session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM reminders WHERE sent_at IS NULL AND due_at <= :now ORDER BY due_at"
+        ), {"now": DateTime.now()}).all()
+        print("claim query plan:", '; '.join(row[-1] for row in plan))
+
+        # drain day by day, the way the once-a-minute beat task would
+        per_minute, claims, claim_time = Counter(), 0, 0.0
+        for day in range(args.days + 2):
+            now = DateTime.combine(start + timedelta(days=day), Time(0)) - timedelta(seconds=1)
+            while True:
+                began = time.perf_counter()
+                due = reminders.claim_due_reminders(db.session, now=now)
+                claim_time += time.perf_counter() - began
+                if not due:
+                    break
+                claims += 1
+            for (due_at,) in db.session.execute(select(Reminder.due_at).where(Reminder.sent_at == now)):
+                per_minute[str(due_at)[:16]] += 1
+        total = sum(per_minute.values())
+        print(f"claim_due_reminders: {total} reminders in {claims} claims, {claim_time:.2f}s "
+              f"({claim_time / max(total, 1) * 1e6:.1f} us/reminder)")
+        if per_minute:
+            print(f"busiest minute: {max(per_minute.values())} reminders "
+                  f"(a single 08:00 batch would send all of a day's ~{total // args.days} at once)")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Clinical search on a million synthetic treatments.
+
+    python bench_search.py [--treatments 1000000] [--doctors 500] [--repeat 5]
+
+Uses a throwaway SQLite file and only the models and search.py, not new.py.
+Treatments are loaded without the FTS triggers, so the timing of
+rebuild_search_index (what `flask rebuild-search-index` runs) covers indexing
+the whole corpus. The text mixes a Zipf-like clinical vocabulary, where the
+top terms appear in a large share of rows, with a few rare terms. For a
+typical doctor (about treatments/doctors rows) it then times SEARCH_SQL and
+COUNT_SQL separately: common, rare, two-term and prefix queries, on page 1
+and on a deep page.
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from datetime import date as Date, timedelta
+from flask import Flask
+from sqlalchemy import text
+
+from models import db, Appointment, Treatment
+import search
+
+COMMON = ('fever cough headache pain fatigue hypertension diabetes infection viral review '
+          'mild moderate severe chronic acute persistent').split()
+DRUGS = ('paracetamol ibuprofen amoxicillin metformin amlodipine atorvastatin omeprazole '
+         'salbutamol cetirizine azithromycin losartan insulin').split()
+FILLER = ('patient advised rest fluids follow up after week days twice daily meals '
+          'blood pressure normal elevated reports improvement continue dose').split()
+RARE = ('sarcoidosis', 'kawasaki', 'pheochromocytoma', 'amyloidosis')
+
+QUERIES = (
+    ('common', 'fever'),
+    ('common x2', 'fever cough'),
+    ('drug', 'metformin'),
+    ('prefix', 'hyper*'),
+    ('rare', 'sarcoidosis'),
+    ('no hits', 'zzzz'),
+)
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    db.init_app(app)
+    return app
+
+
+def zipf_choice(rng, words):
+    # rank r is picked with weight 1/r
+    weights = [1 / (r + 1) for r in range(len(words))]
+    return rng.choices(words, weights, k=1)[0]
+
+
+def note(rng, words, extra=()):
+    parts = [zipf_choice(rng, COMMON) for _ in range(2)] + [rng.choice(FILLER) for _ in range(words)]
+    parts += extra
+    rng.shuffle(parts)
+    return ' '.join(parts)
+
+
+def seed(n, doctors, batch=50000):
+    rng = random.Random(1)
+    start = Date(2020, 1, 1)
+    conn = db.session.connection()
+    for offset in range(0, n, batch):
+        size = min(batch, n - offset)
+        appointments, treatments = [], []
+        for i in range(offset + 1, offset + size + 1):
+            appointments.append({"id": i, "patient_id": 1 + rng.randrange(20000),
+                                 "doctor_id": 1 + rng.randrange(doctors),
+                                 "date": start + timedelta(days=rng.randrange(2000)), "status": 'Completed'})
+            rare = (rng.choice(RARE),) if rng.random() < 0.0005 else ()
+            treatments.append({"id": i, "appointment_id": i,
+                               "diagnosis": note(rng, 2, rare),
+                               "prescription": f"{zipf_choice(rng, DRUGS)} {rng.choice((250, 500, 1000))} mg "
+                                               + note(rng, 3),
+                               "notes": note(rng, 12)})
+        conn.execute(Appointment.__table__.insert(), appointments)
+        conn.execute(Treatment.__table__.insert(), treatments)
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        began = time.perf_counter()
+        result = fn()
+        spent = time.perf_counter() - began
+        best = spent if best is None else min(best, spent)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--treatments', type=int, default=1000000)
+    parser.add_argument('--doctors', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--deep-page', type=int, default=20)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = make_app(path)
+    with app.app_context():
+        db.create_all()
+        began = time.perf_counter()
+        seed(args.treatments, args.doctors)
+        print(f"{args.treatments} treatments, {args.doctors} doctors, loaded in {time.perf_counter() - began:.1f}s")
+
+        began = time.perf_counter()
+        indexed = search.rebuild_search_index(db.engine)
+        print(f"rebuild_search_index: {indexed} rows in {time.perf_counter() - began:.1f}s, "
+              f"database {os.path.getsize(path) / 2 ** 20:.0f} MiB")
+
+        # the doctor with the median number of treatments
+        counts = db.session.execute(text(
+            "SELECT doctor_id, count(*) FROM appointments GROUP BY doctor_id ORDER BY 2")).all()
+        doctor_id, own = counts[len(counts) // 2]
+        print(f"doctor {doctor_id}: {own} treatments; best of {args.repeat} runs")
+        print(f"  {'query':<11}{'corpus hits':>12}{'doctor hits':>12}"
+              f"{'page 1 ms':>11}{f'page {args.deep_page} ms':>12}{'count ms':>10}")
+        for label, q in QUERIES:
+            match = search.to_match_query(q)
+            corpus = db.session.execute(text(f"SELECT count(*) FROM {search.FTS_TABLE} WHERE {search.FTS_TABLE} "
+                                             f"MATCH :query"), {"query": match}).scalar()
+            params = {"query": match, "doctor_id": doctor_id, "limit": 20, "offset": 0}
+            _, first = timed(lambda: db.session.execute(text(search.SEARCH_SQL), params).all(), args.repeat)
+            deep_params = dict(params, offset=(args.deep_page - 1) * 20)
+            _, deep = timed(lambda: db.session.execute(text(search.SEARCH_SQL), deep_params).all(), args.repeat)
+            total, count = timed(lambda: db.session.execute(text(search.COUNT_SQL), params).scalar(), args.repeat)
+            print(f"  {label:<11}{corpus:>12}{total:>12}{first * 1000:>11.1f}{deep * 1000:>12.1f}{count * 1000:>10.1f}")
+
+        _, full = timed(lambda: search.search_treatments(db.session, doctor_id, 'fever', 1, 20), args.repeat)
+        print(f"search_treatments('fever'), page + count + highlighting: {full * 1000:.1f} ms")
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Throughput under many connections: gthread vs gevent, both behind admission control.
+
+    python bench_serving.py [--connections 16,64,256] [--seconds 10] [--io-ms 50] [--workers 2]
+
+Starts gunicorn with gunicorn.conf.py once per HMS_WORKER_CLASS, serving a
+small app rather than new.py. Each request does what a typical dashboard call
+does: one SQLite read (a doctor's upcoming appointments) followed by a wait
+on the network, standing in for Redis, SMTP or the Celery broker (--io-ms,
+time.sleep, which gevent patches). The app is wrapped by init_admission
+with the limits new.py would pick for that worker class
+(admission.default_limits), unless --no-admission is given.
+
+For each number of concurrent keep-alive connections it reports successful
+requests per second, their p50/p95 latency, how many were shed with 503 and
+how many failed outright (refused, reset or timed out).
+"""
+import os
+import sys
+import time
+import socket
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import date as Date, time as Time, timedelta
+from flask import Flask, jsonify
+
+from models import db, Appointment
+from admission import init_admission, default_limits
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DOCTORS = 50
+
+
+def create_app():
+    # the app gunicorn serves, configured by start_server() through the environment
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.environ['BENCH_DB']
+    io_wait = float(os.environ['BENCH_IO_MS']) / 1000
+
+    @app.route('/dashboard/<int:doctor_id>')
+    def dashboard(doctor_id):
+        rows = Appointment.query.filter_by(doctor_id=doctor_id, status='Booked').order_by(
+            Appointment.date, Appointment.time).limit(20).all()
+        time.sleep(io_wait)
+        return jsonify([{"id": a.id, "date": str(a.date), "time": str(a.time)} for a in rows])
+
+    if os.environ.get('BENCH_ADMISSION') == '1':
+        max_concurrent, max_streams = default_limits(os.environ['HMS_WORKER_CLASS'],
+                                                     int(os.environ['HMS_THREADS']),
+                                                     int(os.environ['HMS_WORKER_CONNECTIONS']))
+        app.config['ADMISSION_MAX_CONCURRENT'] = max_concurrent
+        app.config['ADMISSION_MAX_STREAMS'] = max_streams
+        # as in new.py: one pooled connection per admitted request
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': max_concurrent}
+        init_admission(app)
+    db.init_app(app)
+    return app
+
+
+def seed(path, appointments=20000):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    db.init_app(app)
+    rng = random.Random(1)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Appointment.__table__.insert(), [
+            {"patient_id": 1 + rng.randrange(1000), "doctor_id": 1 + rng.randrange(DOCTORS),
+             "date": Date(2027, 1, 1) + timedelta(days=rng.randrange(90)),
+             "time": Time(rng.randrange(9, 17), rng.choice((0, 15, 30, 45))), "status": 'Booked'}
+            for _ in range(appointments)])
+        db.session.commit()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(worker_class, workers, path, io_ms, admission):
+    port = free_port()
+    env = dict(os.environ, HMS_WORKER_CLASS=worker_class, HMS_WORKERS=str(workers),
+               HMS_BIND=f"127.0.0.1:{port}", HMS_THREADS=os.environ.get('HMS_THREADS', '8'),
+               HMS_WORKER_CONNECTIONS=os.environ.get('HMS_WORKER_CONNECTIONS', '1000'),
+               BENCH_DB=path, BENCH_IO_MS=str(io_ms), BENCH_ADMISSION='1' if admission else '0')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning',
+         'bench_serving:create_app()'], cwd=HERE, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/dashboard/1')
+            conn.getresponse().read()
+            conn.close()
+            return server, port
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+
+
+def client(port, stop, results):
+    rng = random.Random()
+    ok, shed, failed = [], 0, 0
+    conn = None
+    while time.time() < stop:
+        if conn is None:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        began = time.perf_counter()
+        try:
+            conn.request('GET', f"/dashboard/{1 + rng.randrange(DOCTORS)}")
+            response = conn.getresponse()
+            response.read()
+        except OSError:
+            failed += 1
+            conn.close()
+            conn = None
+            continue
+        if response.status == 200:
+            ok.append(time.perf_counter() - began)
+        elif response.status == 503:
+            shed += 1
+            # honour Retry-After loosely, as the frontend does, without stalling the run
+            time.sleep(0.05)
+        else:
+            failed += 1
+        if response.will_close:
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+    results.append((ok, shed, failed))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def drive(port, connections, seconds):
+    stop = time.time() + seconds
+    results = []
+    threads = [threading.Thread(target=client, args=(port, stop, results)) for _ in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ok = [v for values, _, _ in results for v in values]
+    return (len(ok) / seconds, percentile(ok, .5), percentile(ok, .95),
+            sum(n for _, n, _ in results), sum(n for _, _, n in results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', default='16,64,256')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--io-ms', type=float, default=50, help="simulated network wait per request")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--worker-classes', default='gthread,gevent')
+    parser.add_argument('--no-admission', action='store_true')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    seed(path)
+    print(f"{args.workers} workers, {args.io_ms:.0f} ms simulated I/O per request, {args.seconds:.0f}s per run, "
+          f"admission {'off' if args.no_admission else 'on'}, {os.cpu_count()} CPU(s)")
+    print(f"  {'worker':<8}{'conns':>6}{'limits':>10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'shed':>8}{'failed':>8}")
+    try:
+        for worker_class in args.worker_classes.split(','):
+            limits = default_limits(worker_class, int(os.environ.get('HMS_THREADS', 8)),
+                                    int(os.environ.get('HMS_WORKER_CONNECTIONS', 1000)))
+            limits = '-' if args.no_admission else f"{limits[0]}/{limits[1]}"
+            server, port = start_server(worker_class, args.workers, path, args.io_ms, not args.no_admission)
+            try:
+                for connections in (int(n) for n in args.connections.split(',')):
+                    rate, p50, p95, shed, failed = drive(port, connections, args.seconds)
+                    print(f"  {worker_class:<8}{connections:>6}{limits:>10}{rate:>9.0f}{p50 * 1000:>9.1f}"
+                          f"{p95 * 1000:>9.1f}{shed:>8}{failed:>8}")
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
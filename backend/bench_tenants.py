@@ -0,0 +1,137 @@
+"""Aggregate write throughput as hospitals (tenants) are added.
+
+    python bench_tenants.py [--writers 8] [--tenants 1,2,4,8] [--seconds 5]
+
+Uses throwaway SQLite files and only the models and tenants.py, not new.py.
+For each tenant count, HMS_TENANTS-style binds are configured and the same
+number of writer processes are spread round-robin over the hospitals. Every
+writer does what patient_book_appointment does: check the slot, insert an
+Appointment, commit. With WAL and synchronous=NORMAL, as tenants.py sets
+them, it reports commits per second, commit latency and how many
+transactions hit 'database is locked' (a 503 in new.py) within the busy
+timeout. With one tenant every writer queues on the same file lock; with
+one tenant per writer nobody does. --synchronous FULL adds an fsync to every
+commit, which is where the lock is held longest on a real disk.
+"""
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from datetime import date as Date, time as Time, timedelta
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from models import db, Appointment
+from tenants import configure_tenants, known_tenants, tenant_context, tenant_engine
+
+
+def make_app(directory, tenants, busy_timeout):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(directory, 'default.db')
+    app.config['TENANT_DATABASES'] = {
+        f"h{i}": 'sqlite:///' + os.path.join(directory, f"h{i}.db") for i in range(1, tenants)}
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': busy_timeout}}
+    configure_tenants(app)
+    db.init_app(app)
+    return app
+
+
+def set_synchronous(mode):
+    # runs after tenants.py's own connect hook, so it overrides synchronous=NORMAL
+    @event.listens_for(Engine, 'connect')
+    def _synchronous(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA synchronous={mode}')
+        cursor.close()
+
+
+def writer(directory, tenants, index, busy_timeout, synchronous, ready, go, seconds, results):
+    set_synchronous(synchronous)
+    app = make_app(directory, tenants, busy_timeout)
+    tenant = known_tenants(app)[index % tenants]
+    rng = random.Random(index)
+    latencies, locked = [], 0
+    with app.app_context(), tenant_context(tenant):
+        # open the connection before the clock starts
+        Appointment.query.first()
+        ready.put(index)
+        go.wait()
+        stop = time.time() + seconds
+        while time.time() < stop:
+            day = Date(2027, 1, 1) + timedelta(days=rng.randrange(365))
+            slot = Time(rng.randrange(9, 17), rng.choice((0, 15, 30, 45)))
+            doctor_id = rng.randrange(1, 50)
+            began = time.perf_counter()
+            try:
+                taken = Appointment.query.filter_by(doctor_id=doctor_id, date=day, time=slot, status='Booked').first()
+                if taken is None:
+                    db.session.add(Appointment(patient_id=index + 1, doctor_id=doctor_id, date=day, time=slot,
+                                               status='Booked'))
+                db.session.commit()
+                latencies.append(time.perf_counter() - began)
+            except OperationalError:
+                db.session.rollback()
+                locked += 1
+        db.session.remove()
+    results.put((tenant, latencies, locked))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def run(tenants, writers, seconds, busy_timeout, synchronous, parent):
+    directory = tempfile.mkdtemp(dir=parent)
+    app = make_app(directory, tenants, busy_timeout)
+    with app.app_context():
+        for tenant in known_tenants(app):
+            db.metadata.create_all(bind=tenant_engine(db, tenant))
+        db.engine.dispose()
+
+    ctx = multiprocessing.get_context('spawn')
+    ready, go, results = ctx.Queue(), ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=writer, args=(directory, tenants, i, busy_timeout, synchronous, ready, go, seconds, results))
+             for i in range(writers)]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        ready.get()
+    go.set()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    latencies = [v for _, values, _ in collected for v in values]
+    locked = sum(n for _, _, n in collected)
+    return len(latencies) / seconds, percentile(latencies, .5), percentile(latencies, .95), locked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--tenants', default='1,2,4,8')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--busy-timeout', type=float, default=5.0)
+    parser.add_argument('--synchronous', choices=('NORMAL', 'FULL'), default='NORMAL',
+                        help="FULL fsyncs every commit while holding the write lock")
+    parser.add_argument('--dir', help="where to put the databases (default: the temp dir)")
+    args = parser.parse_args()
+
+    print(f"{args.writers} writer processes, {args.seconds:.0f}s per run, busy timeout {args.busy_timeout}s, "
+          f"synchronous={args.synchronous}, {os.cpu_count()} CPU(s)")
+    print(f"  {'tenants':>7}{'commits/s':>12}{'p50 ms':>9}{'p95 ms':>9}{'locked':>8}")
+    for tenants in (int(n) for n in args.tenants.split(',')):
+        rate, p50, p95, locked = run(tenants, args.writers, args.seconds, args.busy_timeout,
+                                    args.synchronous, args.dir)
+        print(f"  {tenants:>7}{rate:>12.0f}{p50 * 1000:>9.2f}{p95 * 1000:>9.2f}{locked:>8}")
+
+
+if __name__ == '__main__':
+    main()
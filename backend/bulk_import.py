@@ -0,0 +1,334 @@
+import os
+import csv
+import json
+from datetime import datetime as DateTime, time as Time, date as Date
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash
+from models import User, Department, DoctorProfile, PatientProfile, Appointment, Treatment
+
+# ---------------------------
+# Bulk import (hospital migration)
+# ---------------------------
+# Streams CSV or JSONL rows in batches: each batch is validated, passwords are
+# hashed in a process pool, rows go in with executemany, and the batch commits
+# on its own. Usernames, departments and appointment keys are resolved from
+# in-memory maps instead of per-row queries. After every commit the last line
+# number is written to <file>.progress, so a rerun continues from there; rows
+# that already exist are skipped either way. Bad rows go to <file>.rejects.jsonl.
+
+KINDS = ('doctors', 'patients', 'appointments', 'treatments')
+STATUSES = ('Booked', 'Completed', 'Cancelled')
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+
+
+class RowError(ValueError):
+    pass
+
+
+def _hash_password(password):
+    return generate_password_hash(password)
+
+
+def read_records(path):
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            for lineno, record in enumerate(csv.DictReader(f), start=2):
+                yield lineno, record
+    else:
+        with open(path, encoding='utf-8') as f:
+            for lineno, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                # a bad line becomes a reject instead of stopping every rerun there
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    record = {"__error__": f"invalid JSON: {e}", "__raw__": line.rstrip('\n')}
+                if not isinstance(record, dict):
+                    record = {"__error__": "line is not a JSON object", "__raw__": line.rstrip('\n')}
+                yield lineno, record
+
+
+def _batches(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _text(record, field):
+    # JSONL can carry numbers, lists or objects where CSV only has strings
+    value = record.get(field)
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise RowError(f"{field} must be text")
+
+
+def _required(record, field):
+    value = (_text(record, field) or '').strip()
+    if not value:
+        raise RowError(f"{field} required")
+    return value
+
+
+def _flag(record, field, default):
+    value = record.get(field)
+    if value in (None, ''):
+        return default
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def _parse_date(value):
+    try:
+        return Date.fromisoformat(str(value))
+    except ValueError:
+        raise RowError("date must be YYYY-MM-DD")
+
+
+def _parse_time(value):
+    try:
+        return Time.fromisoformat(str(value))
+    except ValueError:
+        raise RowError("time must be HH:MM[:SS]")
+
+
+class Importer:
+    def __init__(self, session, kind, workers=None):
+        self.session = session
+        self.kind = kind
+        self.workers = workers
+        self.users = dict(session.execute(select(User.username, User.id)).all())
+        self.doctors = set(session.execute(select(User.id).where(User.role == 'doctor')).scalars())
+        self.departments = dict(session.execute(select(Department.name, Department.id)).all())
+        self.appointments = {}
+        self.booked = set()
+        self.treated = set()
+        if kind in ('appointments', 'treatments'):
+            self.appointments = {
+                (p, d, str(day), str(t)): i for i, p, d, day, t in session.execute(
+                    select(Appointment.id, Appointment.patient_id, Appointment.doctor_id, Appointment.date, Appointment.time)
+                )
+            }
+        if kind == 'appointments':
+            # same rule as patient_book_appointment: one Booked visit per doctor slot
+            self.booked = {
+                (d, str(day), str(t)) for d, day, t in session.execute(
+                    select(Appointment.doctor_id, Appointment.date, Appointment.time).where(Appointment.status == 'Booked')
+                )
+            }
+        if kind == 'treatments':
+            self.treated = set(session.execute(select(Treatment.appointment_id)).scalars())
+
+    # --- lookups ---
+    def _user_id(self, username, field):
+        user_id = self.users.get(username)
+        if user_id is None:
+            raise RowError(f"unknown {field} {username!r}")
+        return user_id
+
+    def _department_id(self, name):
+        if not name:
+            return None
+        if name not in self.departments:
+            result = self.session.execute(Department.__table__.insert().values(name=name))
+            self.departments[name] = result.inserted_primary_key[0]
+        return self.departments[name]
+
+    def _appointment_key(self, record):
+        doctor = _required(record, 'doctor')
+        doctor_id = self._user_id(doctor, 'doctor')
+        if doctor_id not in self.doctors:
+            raise RowError(f"{doctor!r} is not a doctor")
+        return (
+            self._user_id(_required(record, 'patient'), 'patient'),
+            doctor_id,
+            str(_parse_date(_required(record, 'date'))),
+            str(_parse_time(_required(record, 'time'))),
+        )
+
+    # --- per-kind batch loaders; each returns (inserted, skipped, rejects) ---
+    def _load_people(self, batch, pool, role):
+        valid, skipped, rejects, seen = [], 0, [], set()
+        fields = ('experience', 'availability') if role == 'doctor' else ('full_name', 'contact', 'address')
+        for lineno, record in batch:
+            try:
+                username = _required(record, 'username')
+                if username in self.users or username in seen:
+                    skipped += 1
+                    continue
+                row = {
+                    "username": username,
+                    "password_hash": _text(record, 'password_hash'),
+                    "department": (_text(record, 'department') or '').strip(),
+                    "age": record.get('age'),
+                    "approve": _flag(record, 'approve', True),
+                    "blocked": _flag(record, 'blocked', False),
+                }
+                if not row['password_hash']:
+                    row['password'] = _required(record, 'password')
+                row.update((field, _text(record, field)) for field in fields)
+                seen.add(username)
+                valid.append(row)
+            except RowError as e:
+                rejects.append((lineno, str(e), record))
+        if not valid:
+            return 0, skipped, rejects
+
+        to_hash = [r for r in valid if not r['password_hash']]
+        hashes = pool.map(_hash_password, [r['password'] for r in to_hash], chunksize=64) if to_hash else []
+        for row, hashed in zip(to_hash, hashes):
+            row['password_hash'] = hashed
+
+        now = DateTime.now()
+        self.session.execute(User.__table__.insert(), [{
+            "username": r['username'],
+            "password": r['password_hash'],
+            "role": role,
+            # migrated doctors were already vetted by the old system
+            "approve": r['approve'],
+            "blocked": r['blocked'],
+            "created_at": now,
+        } for r in valid])
+        names = [r['username'] for r in valid]
+        self.users.update(self.session.execute(select(User.username, User.id).where(User.username.in_(names))).all())
+        if role == 'doctor':
+            self.doctors.update(self.users[name] for name in names)
+
+        if role == 'doctor':
+            self.session.execute(DoctorProfile.__table__.insert(), [{
+                "user_id": self.users[r['username']],
+                "specialization_id": self._department_id(r['department']),
+                "experience": r['experience'],
+                "availability": r['availability'],
+            } for r in valid])
+        else:
+            self.session.execute(PatientProfile.__table__.insert(), [{
+                "user_id": self.users[r['username']],
+                "full_name": r['full_name'],
+                "age": int(r['age']) if str(r['age'] or '').isdigit() else None,
+                "contact": r['contact'],
+                "address": r['address'],
+            } for r in valid])
+        return len(valid), skipped, rejects
+
+    def _load_appointments(self, batch, pool):
+        rows, skipped, rejects = [], 0, []
+        for lineno, record in batch:
+            try:
+                key = self._appointment_key(record)
+                if key in self.appointments:
+                    skipped += 1
+                    continue
+                department, remarks = (_text(record, 'department') or '').strip(), _text(record, 'remarks')
+                status = (_text(record, 'status') or 'Booked').strip().capitalize()
+                if status not in STATUSES:
+                    raise RowError(f"status must be one of {', '.join(STATUSES)}")
+                if status == 'Booked':
+                    slot = key[1:]
+                    if slot in self.booked:
+                        raise RowError("doctor already has an appointment at that slot")
+                    self.booked.add(slot)
+                self.appointments[key] = None
+                rows.append({
+                    "patient_id": key[0],
+                    "doctor_id": key[1],
+                    "department_id": self._department_id(department),
+                    "date": Date.fromisoformat(key[2]),
+                    "time": Time.fromisoformat(key[3]),
+                    "status": status,
+                    "remarks": remarks,
+                })
+            except RowError as e:
+                rejects.append((lineno, str(e), record))
+        if rows:
+            self.session.execute(Appointment.__table__.insert(), rows)
+        return len(rows), skipped, rejects
+
+    def _load_treatments(self, batch, pool):
+        pending, skipped, rejects = [], 0, []
+        for lineno, record in batch:
+            try:
+                text = {field: _text(record, field) for field in ('diagnosis', 'prescription', 'notes')}
+                pending.append((lineno, record, self._appointment_key(record), text))
+            except RowError as e:
+                rejects.append((lineno, str(e), record))
+
+        # appointments imported earlier in this run are in the map without an id yet
+        missing = {k for _, _, k, _ in pending if self.appointments.get(k) is None}
+        if missing:
+            patient_ids = {k[0] for k in missing}
+            for i, p, d, day, t in self.session.execute(
+                select(Appointment.id, Appointment.patient_id, Appointment.doctor_id, Appointment.date, Appointment.time)
+                .where(Appointment.patient_id.in_(patient_ids))
+            ):
+                self.appointments[(p, d, str(day), str(t))] = i
+
+        rows = []
+        for lineno, record, key, text in pending:
+            appointment_id = self.appointments.get(key)
+            if appointment_id is None:
+                rejects.append((lineno, "no matching appointment", record))
+            elif appointment_id in self.treated:
+                skipped += 1
+            else:
+                self.treated.add(appointment_id)
+                rows.append(dict(text, appointment_id=appointment_id))
+        if rows:
+            self.session.execute(Treatment.__table__.insert(), rows)
+        return len(rows), skipped, rejects
+
+    def load_batch(self, batch, pool):
+        unreadable = [(n, r['__error__'], {"raw": r['__raw__']}) for n, r in batch if '__error__' in r]
+        batch = [(n, r) for n, r in batch if '__error__' not in r]
+        if self.kind == 'doctors':
+            inserted, skipped, rejects = self._load_people(batch, pool, 'doctor')
+        elif self.kind == 'patients':
+            inserted, skipped, rejects = self._load_people(batch, pool, 'patient')
+        elif self.kind == 'appointments':
+            inserted, skipped, rejects = self._load_appointments(batch, pool)
+        else:
+            inserted, skipped, rejects = self._load_treatments(batch, pool)
+        return inserted, skipped, unreadable + rejects
+
+
+def run_import(session, path, kind, batch_size=5000, workers=None, restart=False, echo=print):
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    progress_path = path + '.progress'
+    rejects_path = path + '.rejects.jsonl'
+    resume_after = 0
+    if not restart and os.path.exists(progress_path):
+        with open(progress_path) as f:
+            saved = json.load(f)
+        if saved.get('kind') == kind:
+            resume_after = saved.get('line', 0)
+            echo(f"resuming after line {resume_after}")
+
+    importer = Importer(session, kind, workers)
+    stats = {"inserted": 0, "skipped": 0, "rejected": 0}
+    records = ((n, r) for n, r in read_records(path) if n > resume_after)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(rejects_path, 'a', encoding='utf-8') as rejects_file:
+        for batch in _batches(records, batch_size):
+            try:
+                inserted, skipped, rejects = importer.load_batch(batch, pool)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            for lineno, error, record in rejects:
+                rejects_file.write(json.dumps({"line": lineno, "error": error, "record": record}, default=str) + '\n')
+            stats["inserted"] += inserted
+            stats["skipped"] += skipped
+            stats["rejected"] += len(rejects)
+            with open(progress_path + '.tmp', 'w') as f:
+                json.dump({"kind": kind, "line": batch[-1][0]}, f)
+            os.replace(progress_path + '.tmp', progress_path)
+            echo(f"line {batch[-1][0]}: {stats['inserted']} inserted, {stats['skipped']} skipped, {stats['rejected']} rejected")
+    return stats
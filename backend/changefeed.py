@@ -0,0 +1,346 @@
+import json
+import time
+import queue
+import logging
+import threading
+from sqlalchemy import event, select, false
+from sqlalchemy.orm import Session
+from models import ChangeLog, Appointment, Treatment, User
+from tenants import current_tenant, DEFAULT_TENANT
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# ---------------------------
+# Change feed
+# ---------------------------
+# Every flush that touches an Appointment, Treatment or User also inserts a
+# ChangeLog row on the same connection, so the log commits (or rolls back)
+# together with the mutation. After commit the entries are published to the
+# broker, which pushes them to the Server-Sent Events streams.
+
+CHANNEL = 'hms:changefeed'
+
+log = logging.getLogger(__name__)
+
+
+def _appointment_payload(a):
+    return {
+        "id": a.id,
+        "patient_id": a.patient_id,
+        "doctor_id": a.doctor_id,
+        "department_id": a.department_id,
+        "date": str(a.date),
+        "time": str(a.time),
+        "status": a.status,
+        "remarks": a.remarks
+    }
+
+
+def _treatment_payload(t):
+    return {
+        "treatment_id": t.id,
+        "appointment_id": t.appointment_id,
+        "diagnosis": t.diagnosis,
+        "prescription": t.prescription,
+        "notes": t.notes
+    }
+
+
+def _user_payload(u):
+    return {"id": u.id, "username": u.username, "role": u.role, "approve": u.approve, "blocked": u.blocked}
+
+
+def _entry_for(session, obj, action):
+    if isinstance(obj, Appointment):
+        return "appointment", obj.patient_id, obj.doctor_id, _appointment_payload(obj)
+    if isinstance(obj, Treatment):
+        row = session.connection().execute(
+            select(Appointment.patient_id, Appointment.doctor_id).where(Appointment.id == obj.appointment_id)
+        ).first()
+        patient_id, doctor_id = (row.patient_id, row.doctor_id) if row else (None, None)
+        return "treatment", patient_id, doctor_id, _treatment_payload(obj)
+    if isinstance(obj, User):
+        # users see changes to their own account; admins see everything
+        patient_id = obj.id if obj.role == 'patient' else None
+        doctor_id = obj.id if obj.role == 'doctor' else None
+        return "user", patient_id, doctor_id, _user_payload(obj)
+    return None
+
+
+def _record_changes(session, flush_context):
+    changes = [(obj, 'insert') for obj in session.new]
+    changes += [(obj, 'update') for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    changes += [(obj, 'delete') for obj in session.deleted]
+
+    pending = session.info.setdefault('changefeed_pending', [])
+    tenant = current_tenant()
+    for obj, action in changes:
+        found = _entry_for(session, obj, action)
+        if not found:
+            continue
+        entity, patient_id, doctor_id, payload = found
+        row = {
+            "entity": entity,
+            "entity_id": obj.id,
+            "action": action,
+            "patient_id": patient_id,
+            "doctor_id": doctor_id,
+            "payload": json.dumps(payload),
+        }
+        result = session.connection().execute(ChangeLog.__table__.insert().values(**row))
+        pending.append({
+            "cursor": result.inserted_primary_key[0],
+            "tenant": tenant,
+            "entity": entity,
+            "entity_id": obj.id,
+            "action": action,
+            "patient_id": patient_id,
+            "doctor_id": doctor_id,
+            "data": payload,
+        })
+
+
+def _publish_committed(session):
+    pending = session.info.pop('changefeed_pending', None)
+    if pending and broker is not None:
+        try:
+            broker.publish(pending)
+        except Exception:
+            pass
+
+
+def _discard_pending(session, previous_transaction):
+    session.info.pop('changefeed_pending', None)
+
+
+# ---------------------------
+# Visibility
+# ---------------------------
+def visible_to(entry, claims):
+    # every hospital shares the broker channel, and ids repeat across hospitals
+    if entry.get('tenant', DEFAULT_TENANT) != claims.get('tenant', DEFAULT_TENANT):
+        return False
+    role = claims.get('role')
+    if role == 'admin':
+        return True
+    if role == 'doctor':
+        return entry.get('doctor_id') == claims.get('user_id')
+    if role == 'patient':
+        return entry.get('patient_id') == claims.get('user_id')
+    return False
+
+
+def scope_query(query, claims):
+    # same rules as visible_to: unknown roles see nothing
+    role = claims.get('role')
+    if role == 'admin':
+        return query
+    if role == 'doctor':
+        return query.filter(ChangeLog.doctor_id == claims.get('user_id'))
+    if role == 'patient':
+        return query.filter(ChangeLog.patient_id == claims.get('user_id'))
+    return query.filter(false())
+
+
+def entry_from_row(row):
+    entry = row.as_dict()
+    entry["patient_id"] = row.patient_id
+    entry["doctor_id"] = row.doctor_id
+    entry["tenant"] = current_tenant()
+    return entry
+
+
+def public_entry(entry):
+    return {k: entry[k] for k in ("cursor", "entity", "entity_id", "action", "data")}
+
+
+# ---------------------------
+# Brokers
+# ---------------------------
+class Subscription:
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+
+class InProcessBroker:
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        sub = Subscription(self.maxsize)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, entries):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait(entries)
+            except queue.Full:
+                # slow consumer: end its stream, the client reconnects with
+                # Last-Event-ID and catches up from the change_log table
+                sub.overflowed = True
+
+    def drop_all(self):
+        # entries may have been missed: end every stream so clients replay
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.overflowed = True
+            try:
+                # wake the stream now rather than at its next keep-alive
+                sub.queue.put_nowait([])
+            except queue.Full:
+                pass
+
+
+class RedisBroker:
+    # One pub/sub listener per process fans messages out to local subscribers.
+    # When Redis fails (publish error, dropped or re-established listener
+    # connection) the local streams are ended so clients replay the gap from
+    # change_log, and again once Redis is back. In between, publishes only
+    # reach this process's subscribers.
+    def __init__(self, client, channel=CHANNEL, retry_interval=2.0):
+        self.client = client
+        self.channel = channel
+        self.retry_interval = retry_interval
+        self.local = InProcessBroker()
+        self._listener = None
+        self._lock = threading.Lock()
+        self._down = False
+        self._retry_at = 0.0
+
+    def _mark_down(self, error):
+        with self._lock:
+            was_down, self._down = self._down, True
+            self._retry_at = time.monotonic() + self.retry_interval
+        if not was_down:
+            log.warning("changefeed: Redis unavailable (%s); ending streams, publishing in-process", error)
+            self.local.drop_all()
+
+    def _mark_up(self):
+        with self._lock:
+            was_down, self._down = self._down, False
+        if was_down:
+            log.warning("changefeed: Redis is back; ending streams so they replay the outage")
+            self.local.drop_all()
+
+    def _reconnected(self, connection):
+        # redis-py re-subscribed by itself; anything published in between is lost
+        self.local.drop_all()
+
+    def _listen(self):
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                pubsub.connection.register_connect_callback(self._reconnected)
+                self._mark_up()
+                for message in pubsub.listen():
+                    try:
+                        self.local.publish(json.loads(message['data']))
+                    except (TypeError, ValueError):
+                        continue
+            except Exception as e:
+                self._mark_down(e)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            time.sleep(self.retry_interval)
+
+    def subscribe(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='changefeed-redis', daemon=True)
+                self._listener.start()
+        return self.local.subscribe()
+
+    def unsubscribe(self, sub):
+        self.local.unsubscribe(sub)
+
+    def _listening(self):
+        return self._listener is not None and self._listener.is_alive()
+
+    def publish(self, entries):
+        # while Redis is down the listener thread probes it; processes without
+        # one (Celery workers) retry here every retry_interval
+        if self._down and (self._listening() or time.monotonic() < self._retry_at):
+            self.local.publish(entries)
+            return
+        try:
+            self.client.publish(self.channel, json.dumps(entries))
+        except redis.RedisError as e:
+            self._mark_down(e)
+            self.local.publish(entries)
+            return
+        if self._down:
+            self._mark_up()
+
+
+def make_broker(redis_url):
+    if redis is not None and redis_url:
+        try:
+            client = redis.Redis.from_url(redis_url, socket_connect_timeout=1)
+            client.ping()
+            return RedisBroker(client)
+        except Exception:
+            pass
+    return InProcessBroker()
+
+
+broker = None
+
+
+def init_changefeed(app):
+    global broker
+    broker = make_broker(app.config.get('CHANGEFEED_REDIS_URL'))
+    event.listen(Session, 'after_flush', _record_changes)
+    event.listen(Session, 'after_commit', _publish_committed)
+    event.listen(Session, 'after_soft_rollback', _discard_pending)
+    return broker
+
+
+# ---------------------------
+# Server-Sent Events
+# ---------------------------
+def format_event(entry):
+    return f"id: {entry['cursor']}\nevent: change\ndata: {json.dumps(public_entry(entry))}\n\n"
+
+
+def event_stream(sub, claims, replay, partial=False, heartbeat=15):
+    last_cursor = 0
+    try:
+        for entry in replay:
+            last_cursor = entry['cursor']
+            yield format_event(entry)
+        if partial:
+            # live entries would jump the gap after this page; reconnect at once
+            yield "retry: 100\n\n"
+            return
+        yield "retry: 3000\n\n"
+        while not sub.overflowed:
+            try:
+                entries = sub.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            for entry in entries:
+                if entry['cursor'] > last_cursor and visible_to(entry, claims):
+                    last_cursor = entry['cursor']
+                    yield format_event(entry)
+    finally:
+        broker.unsubscribe(sub)
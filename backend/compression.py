@@ -0,0 +1,177 @@
+import gzip
+import zlib
+import threading
+from collections import OrderedDict
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ---------------------------
+# Response compression
+# ---------------------------
+# after_request hook that negotiates Accept-Encoding for JSON/text bodies
+# above COMPRESS_MIN_SIZE. GET responses get an ETag (suffixed with the
+# encoding) so repeat requests can be answered with 304, and the compressed
+# bytes are kept in a small LRU keyed by that ETag.
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/css', 'text/csv', 'text/plain', 'text/javascript')
+
+
+class _Gzip:
+    def __init__(self, level):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+class _Brotli:
+    def __init__(self, level):
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._obj.process(data)
+
+    def finish(self):
+        return self._obj.finish()
+
+
+class _Zstd:
+    def __init__(self, level):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+def available_encodings():
+    encodings = {}
+    if brotli is not None:
+        encodings['br'] = (_Brotli, 5, lambda data, level: brotli.compress(data, quality=level))
+    if zstandard is not None:
+        encodings['zstd'] = (_Zstd, 3, lambda data, level: zstandard.ZstdCompressor(level=level).compress(data))
+    encodings['gzip'] = (_Gzip, 6, lambda data, level: gzip.compress(data, compresslevel=level, mtime=0))
+    return encodings
+
+
+def negotiate(accept_encoding, encodings):
+    # pick the server-preferred encoding among those the client accepts with q > 0
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    for name in encodings:
+        if accepted.get(name, accepted.get('*', 0)) > 0:
+            return name
+    return None
+
+
+class CompressedCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+def _stream(iterable, compressor):
+    for chunk in iterable:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def init_compression(app):
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_CACHE_ENTRIES', 256)
+    encodings = available_encodings()
+    compressed_cache = CompressedCache(app.config['COMPRESS_CACHE_ENTRIES'])
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or 'X-Sendfile' in response.headers or 'X-Accel-Redirect' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request.headers.get('Accept-Encoding'), encodings)
+
+        if response.is_streamed:
+            if encoding:
+                factory, level, _ = encodings[encoding]
+                response.response = _stream(response.response, factory(level))
+                response.headers.pop('Content-Length', None)
+                response.headers['Content-Encoding'] = encoding
+            return response
+
+        body = response.get_data()
+        cacheable = request.method == 'GET' and response.status_code == 200
+        if cacheable and not response.get_etag()[0]:
+            response.add_etag()
+        etag, weak = response.get_etag()
+
+        if not encoding or len(body) < app.config['COMPRESS_MIN_SIZE']:
+            if cacheable:
+                response.make_conditional(request)
+            return response
+
+        _, level, compress = encodings[encoding]
+        key = (etag, encoding) if cacheable and etag else None
+        data = compressed_cache.get(key) if key else None
+        if data is None:
+            data = compress(body, level)
+            if key:
+                compressed_cache.set(key, data)
+
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak=weak)
+        if cacheable:
+            response.make_conditional(request)
+        return response
+
+    return compressed_cache
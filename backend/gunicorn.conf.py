@@ -0,0 +1,30 @@
+import os
+
+# gunicorn -c gunicorn.conf.py
+#
+# HMS_WORKER_CLASS=gthread (default): a fixed pool of HMS_THREADS threads per
+# worker. new.py sizes admission control from it (admission.default_limits):
+# HMS_THREADS/2 requests in flight and HMS_THREADS/4 open SSE streams, so an
+# overload waits in the remaining threads and is shed with 503 + Retry-After
+# after ADMISSION_QUEUE_TIMEOUT instead of piling up. Raise HMS_THREADS for
+# more dashboards.
+# HMS_WORKER_CLASS=gevent: sockets are monkeypatched, so a request waiting on
+# SMTP, Redis or the Celery broker yields to other requests and one worker can
+# hold HMS_WORKER_CONNECTIONS connections, SSE streams included. The caps
+# become a tenth (requests) and half (streams) of HMS_WORKER_CONNECTIONS.
+# SQLite is not cooperative: a query, and any wait on another writer's lock,
+# runs inside sqlite3's C code and blocks every greenlet in that worker. Under
+# gevent the busy timeout therefore drops to 0.25s (SQLITE_BUSY_TIMEOUT), so a
+# locked database turns into a quick 503 + Retry-After instead of a frozen
+# worker. Write-heavy deployments are better served by gthread.
+# gunicorn and gevent are listed in both requirements files.
+
+wsgi_app = 'new:app'
+bind = os.environ.get('HMS_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('HMS_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('HMS_WORKERS', 2))
+threads = int(os.environ.get('HMS_THREADS', 8))
+worker_connections = int(os.environ.get('HMS_WORKER_CONNECTIONS', 1000))
+timeout = 60
+# SSE streams stay open; keep-alive comments every 15s stop them from being reaped as idle
+keepalive = 20
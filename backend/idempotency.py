@@ -0,0 +1,215 @@
+import json
+import time
+import logging
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import g, request, jsonify
+from flask_jwt_extended import get_jwt
+from tenants import current_tenant
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# ---------------------------
+# Idempotency keys
+# ---------------------------
+# A mutating request that carries an Idempotency-Key header runs at most once
+# per (hospital, caller, method, path, key). The first request takes an
+# in-flight lock. Its response is then stored for IDEMPOTENCY_TTL seconds, and
+# retries get that response replayed before any route code or query runs.
+# A retry that arrives while the first is still running gets 409 +
+# Retry-After. Reusing a key with a different body is a 422. 5xx responses are
+# not stored, so those requests can be retried for real.
+#
+# Records live in Redis so every gunicorn worker sees them. Without Redis (at
+# startup, or whenever a Redis call fails later) each process falls back to
+# its own LocalStore. That only catches retries that land on the same process,
+# so with the default 2 workers a retry can still run twice during an outage.
+
+HEADER = 'Idempotency-Key'
+MUTATING = ('POST', 'PUT', 'PATCH', 'DELETE')
+MAX_KEY_LENGTH = 255
+# never store or replay login responses, they carry fresh access tokens
+EXEMPT_PATHS = ('/login', '/admin/login')
+REPLAYED_HEADERS = ('Content-Type', 'Location', 'Retry-After')
+
+PREFIX = 'hms:idem:'
+
+log = logging.getLogger(__name__)
+
+
+class LocalStore:
+    # per-process fallback; expired records are evicted on access and from the
+    # oldest end once the store is over max_entries
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._records:
+            key, (expires, _) = next(iter(self._records.items()))
+            if expires > now and len(self._records) <= self.max_entries:
+                return
+            del self._records[key]
+
+    def get(self, key):
+        with self._lock:
+            found = self._records.get(key)
+            if found is None or found[0] <= time.monotonic():
+                return None
+            return found[1]
+
+    def lock(self, key, record, ttl):
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            found = self._records.get(key)
+            if found is not None and found[0] > now:
+                return False
+            self._records[key] = (now + ttl, record)
+            self._records.move_to_end(key)
+            return True
+
+    def save(self, key, record, ttl):
+        with self._lock:
+            self._records[key] = (time.monotonic() + ttl, record)
+            self._records.move_to_end(key)
+
+    def release(self, key):
+        with self._lock:
+            self._records.pop(key, None)
+
+
+class RedisStore:
+    # SET NX PX is the in-flight lock; Redis expiry does the TTL eviction.
+    # While Redis is unreachable every call goes to the per-process fallback.
+    def __init__(self, client, fallback=None):
+        self.client = client
+        self.fallback = fallback if fallback is not None else LocalStore()
+        self._down = False
+
+    def _call(self, name, redis_call, *args):
+        try:
+            result = redis_call()
+        except redis.RedisError as e:
+            if not self._down:
+                log.warning("idempotency: Redis unavailable (%s); using the per-process store", e)
+                self._down = True
+            return getattr(self.fallback, name)(*args)
+        if self._down:
+            log.warning("idempotency: Redis is back")
+            self._down = False
+        return result
+
+    def get(self, key):
+        raw = self._call('get', lambda: self.client.get(PREFIX + key), key)
+        if isinstance(raw, (bytes, str)):
+            return json.loads(raw)
+        return raw
+
+    def lock(self, key, record, ttl):
+        return bool(self._call(
+            'lock', lambda: self.client.set(PREFIX + key, json.dumps(record), nx=True, px=int(ttl * 1000)),
+            key, record, ttl))
+
+    def save(self, key, record, ttl):
+        self._call('save', lambda: self.client.set(PREFIX + key, json.dumps(record), px=int(ttl * 1000)),
+                   key, record, ttl)
+
+    def release(self, key):
+        self._call('release', lambda: self.client.delete(PREFIX + key), key)
+
+
+def make_store(redis_url):
+    if redis is not None and redis_url:
+        try:
+            client = redis.Redis.from_url(redis_url, socket_connect_timeout=1, socket_timeout=1)
+            client.ping()
+            return RedisStore(client)
+        except Exception as e:
+            log.warning("idempotency: Redis unavailable (%s); keys are only checked per process", e)
+    return LocalStore()
+
+
+def _caller():
+    try:
+        claims = get_jwt()
+    except RuntimeError:
+        return 'anonymous'
+    return str(claims.get('sub'))
+
+
+def _scoped_key(key):
+    raw = '\x1f'.join((current_tenant(), _caller(), request.method, request.path, key))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _fingerprint():
+    return hashlib.sha256(request.get_data(cache=True)).hexdigest()
+
+
+def _replay(record):
+    body = base64.b64decode(record['body'])
+    headers = [(k, v) for k, v in record['headers']]
+    headers.append(('Idempotent-Replayed', 'true'))
+    return body, record['status'], headers
+
+
+def init_idempotency(app):
+    app.config.setdefault('IDEMPOTENCY_TTL', 24 * 3600)
+    app.config.setdefault('IDEMPOTENCY_LOCK_TTL', 60)
+    store = make_store(app.config.get('IDEMPOTENCY_REDIS_URL'))
+
+    @app.before_request
+    def check_idempotency_key():
+        key = request.headers.get(HEADER)
+        if not key or request.method not in MUTATING or request.path in EXEMPT_PATHS:
+            return None
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"message": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"}), 400
+
+        scoped, fingerprint = _scoped_key(key), _fingerprint()
+        if not store.lock(scoped, {"state": "running", "fingerprint": fingerprint}, app.config['IDEMPOTENCY_LOCK_TTL']):
+            record = store.get(scoped)
+            if record is None:
+                # expired between the two calls; let the client try again
+                return jsonify({"message": "Request in progress, please retry"}), 409, {"Retry-After": "1"}
+            if record['fingerprint'] != fingerprint:
+                return jsonify({"message": f"{HEADER} was already used for a different request"}), 422
+            if record['state'] == 'running':
+                return jsonify({"message": "Request in progress, please retry"}), 409, {"Retry-After": "1"}
+            return _replay(record)
+        g.idempotency = (scoped, fingerprint)
+        return None
+
+    @app.after_request
+    def store_idempotent_response(response):
+        pending = g.pop('idempotency', None)
+        if pending is None:
+            return response
+        scoped, fingerprint = pending
+        if response.status_code >= 500 or response.is_streamed or response.direct_passthrough:
+            store.release(scoped)
+            return response
+        store.save(scoped, {
+            "state": "done",
+            "fingerprint": fingerprint,
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.items() if k in REPLAYED_HEADERS],
+            "body": base64.b64encode(response.get_data()).decode('ascii'),
+        }, app.config['IDEMPOTENCY_TTL'])
+        return response
+
+    @app.teardown_request
+    def release_idempotency_lock(exc=None):
+        # after_request didn't run (unhandled error): free the key for a retry
+        pending = g.pop('idempotency', None)
+        if pending is not None:
+            store.release(pending[0])
+
+    return store
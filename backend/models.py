@@ -1,6 +1,9 @@
+import json
 from flask_sqlalchemy import SQLAlchemy
+from tenants import TenantSession
 
-db = SQLAlchemy()
+# TenantSession routes each query to the current hospital's database
+db = SQLAlchemy(session_options={"class_": TenantSession})
 
 
 # ===========================
@@ -96,3 +99,123 @@ class Treatment(db.Model):
     notes = db.Column(db.Text)
 
     appointment = db.relationship('Appointment')
+
+
+
+# ===========================
+# Change Log (delta feed for dashboards)
+# ===========================
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    id = db.Column(db.Integer, primary_key=True)  # doubles as the ?since= cursor
+    entity = db.Column(db.String(20), nullable=False)  # appointment / treatment / user
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # insert / update / delete
+    patient_id = db.Column(db.Integer, index=True)
+    doctor_id = db.Column(db.Integer, index=True)
+    payload = db.Column(db.Text)  # JSON snapshot of the row
+    created_at = db.Column(db.DateTime, default=db.func.now())
+
+    def as_dict(self):
+        return {
+            "cursor": self.id,
+            "entity": self.entity,
+            "entity_id": self.entity_id,
+            "action": self.action,
+            "data": json.loads(self.payload) if self.payload else None,
+        }
+
+
+
+# ===========================
+# Report Catalog (CSV exports)
+# ===========================
+class Report(db.Model):
+    __tablename__ = 'reports'
+    __table_args__ = (db.Index('ix_reports_owner_created', 'owner_id', 'created_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(200), unique=True, nullable=False)
+    kind = db.Column(db.String(50))  # patient_treatments / doctor_appointments
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # who may download it (admins always can)
+    size = db.Column(db.Integer)
+    row_count = db.Column(db.Integer)
+    checksum = db.Column(db.String(64))  # sha256 of the file
+    created_at = db.Column(db.DateTime, default=db.func.now(), index=True)
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "kind": self.kind,
+            "owner_id": self.owner_id,
+            "size": self.size,
+            "row_count": self.row_count,
+            "checksum": self.checksum,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+
+# ===========================
+# Reminder schedule (due-time index, one row per booked appointment)
+# ===========================
+class Reminder(db.Model):
+    __tablename__ = 'reminders'
+    __table_args__ = (db.Index('ix_reminders_pending', 'sent_at', 'due_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), unique=True, nullable=False)
+    due_at = db.Column(db.DateTime, nullable=False)
+    sent_at = db.Column(db.DateTime)  # set when the dispatcher claims it
+
+
+
+# ===========================
+# Utilization matrices (weekday x hour appointment counts)
+# ===========================
+class UtilizationMatrix(db.Model):
+    __tablename__ = 'utilization_matrices'
+    __table_args__ = (db.UniqueConstraint('scope', 'scope_id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)  # doctor / department
+    scope_id = db.Column(db.Integer, nullable=False)
+    weeks = db.Column(db.Integer, nullable=False)  # length of the history window
+    counts = db.Column(db.LargeBinary, nullable=False)  # 7*24 little-endian uint32, Monday 00:00 first
+    computed_at = db.Column(db.DateTime, default=db.func.now())
+
+
+
+# ===========================
+# Audit Log (append-only; written in batches by audit.py)
+# ===========================
+class AuditLog(db.Model):
+    __tablename__ = 'audit_log'
+    __table_args__ = (
+        db.Index('ix_audit_entity', 'entity', 'entity_id', 'created_at'),
+        db.Index('ix_audit_actor', 'actor_id', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    actor_id = db.Column(db.Integer)  # None for system jobs and anonymous requests
+    actor_role = db.Column(db.String(20))  # admin / doctor / patient / system
+    entity = db.Column(db.String(30), nullable=False)
+    entity_id = db.Column(db.Integer)
+    action = db.Column(db.String(10), nullable=False)  # insert / update / delete
+    before = db.Column(db.Text)  # JSON of the changed columns before the write
+    after = db.Column(db.Text)  # JSON of the changed columns after the write
+    endpoint = db.Column(db.String(120))  # "PUT /admin/doctor/4"
+    ip = db.Column(db.String(45))
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "actor_id": self.actor_id,
+            "actor_role": self.actor_role,
+            "entity": self.entity,
+            "entity_id": self.entity_id,
+            "action": self.action,
+            "before": json.loads(self.before) if self.before else None,
+            "after": json.loads(self.after) if self.after else None,
+            "endpoint": self.endpoint,
+            "ip": self.ip,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
@@ -1,20 +1,37 @@
 import os
 import csv
+import hashlib
+import click
 from io import StringIO
 from datetime import datetime as DateTime, time as Time, date as Date
-from flask import Flask, jsonify, render_template, request, send_from_directory
+from flask import Flask, Response, jsonify, render_template, request, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import func, or_, and_
+from sqlalchemy.exc import OperationalError
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_cors import CORS
 from flask_caching import Cache
 from flask_mail import Mail, Message
-from celery import Celery
+from celery import Celery, chord, group
+from celery.signals import before_task_publish, worker_init
 from celery.schedules import crontab
+from kombu import Queue, Exchange
 
 # import your models
-from models import db, User, Department, DoctorProfile, PatientProfile, Appointment, Treatment
+from models import db, User, Department, DoctorProfile, PatientProfile, Appointment, Treatment, ChangeLog, Report, AuditLog
+from assets import init_assets
+from compression import init_compression
+from changefeed import init_changefeed, scope_query, entry_from_row, event_stream
+from admission import init_admission, default_limits
+from analytics import compute_utilization, recommend_slots
+from audit import init_audit
+from idempotency import init_idempotency
+from bulk_import import run_import, KINDS as IMPORT_KINDS
+from reminders import init_reminders, backfill_reminders, claim_due_reminders, release_reminders
+from search import ensure_search_index, rebuild_search_index, search_treatments, supports_search
+from tenants import (init_tenancy, configure_tenants, parse_tenants, known_tenants, current_tenant,
+                     explicit_tenant, tenant_context, tenant_engine, add_tenant_header, DEFAULT_TENANT)
 
 # ---------------------------
 # App & config
@@ -23,7 +40,15 @@ app = Flask(__name__, template_folder='../frontend', static_folder='../frontend'
 
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Seconds a connection waits on another writer's lock before 'database is locked' (answered with 503).
+# Under gevent that wait happens inside sqlite3's C code and blocks every greenlet in the worker, so keep it short.
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': float(os.environ.get(
+    'SQLITE_BUSY_TIMEOUT', 0.25 if os.environ.get('HMS_WORKER_CLASS') == 'gevent' else 5.0))}}
+# Extra hospitals, each with its own database: HMS_TENANTS="north=sqlite:///north.db,south=sqlite:///south.db"
+app.config['TENANT_DATABASES'] = parse_tenants(os.environ.get('HMS_TENANTS'))
 app.config['JWT_SECRET_KEY'] = 'change_this_to_a_real_secret'
+# EventSource cannot send headers, so /changes/stream also accepts ?jwt=<token>
+app.config['JWT_TOKEN_LOCATION'] = ['headers']
 # Celery / Redis
 app.config['broker_url'] = 'redis://localhost:6379/0'
 app.config['result_backend'] = 'redis://localhost:6379/0'
@@ -32,6 +57,10 @@ app.config['CACHE_TYPE'] = 'RedisCache'
 app.config['CACHE_REDIS_HOST'] = 'localhost'
 app.config['CACHE_REDIS_PORT'] = 6379
 app.config['CACHE_DEFAULT_TIMEOUT'] = 60
+# Change feed fan-out (falls back to an in-process broker when Redis is down)
+app.config['CHANGEFEED_REDIS_URL'] = 'redis://localhost:6379/0'
+# Idempotency-Key records. Without Redis each worker keeps its own, so a retry that reaches another worker runs again
+app.config['IDEMPOTENCY_REDIS_URL'] = 'redis://localhost:6379/0'
 # Mail (configure for your provider)
 app.config['MAIL_SERVER'] = 'smtp.example.com'
 app.config['MAIL_PORT'] = 587
@@ -39,12 +68,46 @@ app.config['MAIL_USE_TLS'] = True
 app.config['MAIL_USERNAME'] = 'your_email@example.com'
 app.config['MAIL_PASSWORD'] = 'your_password'
 app.config['MAIL_DEFAULT_SENDER'] = 'your_email@example.com'
-
+# Appointment reminders go out this many minutes before the visit
+app.config['REMINDER_OFFSET_MINUTES'] = 120
+# Slot recommendations: weeks of appointment history and bookable hours
+app.config['UTILIZATION_HISTORY_WEEKS'] = 52
+app.config['BOOKING_HOURS'] = range(9, 17)
+# Load shedding: in-flight requests and open SSE streams per process, sized from the same
+# HMS_* variables gunicorn.conf.py reads, and how long (s) a request may wait for a slot
+max_concurrent, max_streams = default_limits(os.environ.get('HMS_WORKER_CLASS', 'gthread'),
+                                             int(os.environ.get('HMS_THREADS', 8)),
+                                             int(os.environ.get('HMS_WORKER_CONNECTIONS', 1000)))
+app.config['ADMISSION_MAX_CONCURRENT'] = int(os.environ.get('ADMISSION_MAX_CONCURRENT', max_concurrent))
+app.config['ADMISSION_MAX_STREAMS'] = int(os.environ.get('ADMISSION_MAX_STREAMS', max_streams))
+app.config['ADMISSION_QUEUE_TIMEOUT'] = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 2.0))
+# A request keeps its pooled connection until it returns, network waits included; without
+# this, gevent would stall past the default pool (5 + 10 overflow) long before the cap
+app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] = app.config['ADMISSION_MAX_CONCURRENT']
+# Audit log: 'database' (audit_log table, spills to instance/audit on shutdown failures) or 'jsonl' segments
+app.config['AUDIT_SINK'] = os.environ.get('AUDIT_SINK', 'database')
+# Response compression (bytes; smaller JSON bodies are sent as-is)
+app.config['COMPRESS_MIN_SIZE'] = 1024
+# Behind nginx, set to an internal location aliased to backend/reports (e.g. '/protected-reports')
+# so report downloads are streamed by nginx instead of a Python worker
+app.config['REPORTS_ACCEL_REDIRECT'] = os.environ.get('REPORTS_ACCEL_REDIRECT')
+
+configure_tenants(app)
 db.init_app(app)
+# EventSource can't set headers, so only the SSE stream takes ?jwt=
+init_tenancy(app, query_token_endpoints=('changes_stream',))
 jwt = JWTManager(app)
 cache = Cache(app)
 mail = Mail(app)
 CORS(app)
+asset_template = init_assets(app)
+init_compression(app)
+# after compression so its after_request sees (and stores) the uncompressed body
+init_idempotency(app)
+changefeed_broker = init_changefeed(app)
+audit_writer = init_audit(app)
+init_reminders(app)
+init_admission(app)
 
 # ---------------------------
 # Celery
@@ -54,27 +117,162 @@ def make_celery(app):
     celery.conf.update(app.config)
     class ContextTask(celery.Task):
         def __call__(self, *args, **kwargs):
+            tenant = self.request.get('tenant') or (self.request.get('headers') or {}).get('tenant')
             with app.app_context():
-                return super().__call__(*args, **kwargs)
+                if tenant is None:
+                    return super().__call__(*args, **kwargs)
+                with tenant_context(tenant):
+                    return super().__call__(*args, **kwargs)
     celery.Task = ContextTask
     return celery
 
 celery = make_celery(app)
+before_task_publish.connect(add_tenant_header)
+
+
+def fan_out_tenants(task):
+    # beat runs without a tenant: queue one copy of the task per hospital
+    tenants = known_tenants(app)
+    group(task.s().set(headers={'tenant': t}) for t in tenants).apply_async()
+    return f"queued for {len(tenants)} hospitals"
+
+# Queues keep slow batch work away from time-sensitive sends. Run one worker
+# per queue; WORKER_POOLS then sets its concurrency and prefetch, e.g.:
+#   celery -A new.celery worker -Q notifications -n notify@%h
+#   celery -A new.celery worker -Q exports -n exports@%h
+#   celery -A new.celery worker -Q analytics -n analytics@%h
+# A worker on several queues keeps the global settings below. Measure with
+# `python bench_queues.py`.
+# Redis transport priorities: 0 is served first, 9 last.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+REMINDER_BATCH_SIZE = 50
+WORKER_POOLS = {
+    # short SMTP sends: several in flight, a few reserved per process
+    'notifications': {'concurrency': 4, 'prefetch_multiplier': 4},
+    # long CSV exports and reports: one at a time so none waits behind another
+    'exports': {'concurrency': 2, 'prefetch_multiplier': 1},
+    'analytics': {'concurrency': 1, 'prefetch_multiplier': 1},
+}
+
+celery.conf.update(
+    # each queue needs its own routing key; bare Queue(name) would bind all
+    # three to the default exchange under 'notifications'
+    task_queues=tuple(Queue(name, Exchange(name), routing_key=name) for name in WORKER_POOLS),
+    task_default_queue='notifications',
+    task_routes={
+        'tasks.dispatch_due_reminders': {'queue': 'notifications'},
+        'tasks.send_reminder_batch': {'queue': 'notifications'},
+        'tasks.send_visit_summary': {'queue': 'notifications'},
+        'tasks.export_treatments_csv': {'queue': 'exports'},
+        'tasks.export_professional_service_requests': {'queue': 'exports'},
+        'tasks.monthly_doctor_activity': {'queue': 'analytics'},
+        'tasks.doctor_activity_report': {'queue': 'analytics'},
+        'tasks.monthly_activity_summary': {'queue': 'analytics'},
+        'tasks.compute_utilization': {'queue': 'analytics'},
+    },
+    task_default_priority=PRIORITY_NORMAL,
+    broker_transport_options={
+        'priority_steps': list(range(10)),
+        'queue_order_strategy': 'priority',
+        'visibility_timeout': 3600,
+    },
+    # long exports: hand out one task at a time and only ack once done
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+)
+
+
+@worker_init.connect
+def configure_worker_pool(sender=None, **kwargs):
+    # -c / --prefetch-multiplier on the command line still win
+    queues = set(sender.app.amqp.queues.consume_from or ())
+    pool = WORKER_POOLS.get(queues.pop()) if len(queues) == 1 else None
+    if pool is None:
+        return
+    if not sender.app.conf.worker_concurrency and sender.concurrency == os.cpu_count():
+        sender.concurrency = pool['concurrency']
+    if sender.prefetch_multiplier == sender.app.conf.worker_prefetch_multiplier:
+        sender.prefetch_multiplier = pool['prefetch_multiplier']
 
 # Ensure reports directory exists
 REPORTS_DIR = os.path.join(app.root_path, 'reports')
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
+def tenant_reports_dir():
+    tenant = current_tenant()
+    path = REPORTS_DIR if tenant == DEFAULT_TENANT else os.path.join(REPORTS_DIR, tenant)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def save_report(filename, kind, owner_id, text, row_count):
+    data = text.encode('utf-8')
+    path = os.path.join(tenant_reports_dir(), filename)
+    # write-then-rename so a download never sees a half-written file
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+    report = Report.query.filter_by(filename=filename).first() or Report(filename=filename)
+    report.kind = kind
+    report.owner_id = owner_id
+    report.size = len(data)
+    report.row_count = row_count
+    report.checksum = hashlib.sha256(data).hexdigest()
+    report.created_at = DateTime.now()
+    db.session.add(report)
+    db.session.commit()
+    return path
+
+def sync_report_catalog():
+    # index CSVs written before the catalog existed
+    directory = tenant_reports_dir()
+    known = {r.filename for r in Report.query.with_entities(Report.filename).all()}
+    for filename in os.listdir(directory):
+        if not filename.endswith('.csv') or filename in known:
+            continue
+        with open(os.path.join(directory, filename), 'rb') as f:
+            data = f.read()
+        parts = filename.split('_')
+        owner_id = int(parts[1]) if parts[0] == 'patient' and parts[1].isdigit() else None
+        db.session.add(Report(
+            filename=filename,
+            kind='patient_treatments' if parts[0] == 'patient' else 'doctor_appointments',
+            owner_id=owner_id,
+            size=len(data),
+            row_count=max(data.count(b'\n') - 1, 0),
+            checksum=hashlib.sha256(data).hexdigest(),
+            created_at=DateTime.fromtimestamp(os.path.getmtime(os.path.join(directory, filename)))
+        ))
+    db.session.commit()
+
+def send_report(report):
+    directory = tenant_reports_dir()
+    accel = app.config.get('REPORTS_ACCEL_REDIRECT')
+    if accel:
+        # nginx serves the file itself, including Range and conditional requests
+        relative = os.path.relpath(os.path.join(directory, report.filename), REPORTS_DIR).replace(os.sep, '/')
+        response = Response(mimetype='text/csv')
+        response.headers['X-Accel-Redirect'] = f"{accel.rstrip('/')}/{relative}"
+        response.headers['Content-Disposition'] = f'attachment; filename="{report.filename}"'
+        return response
+    # send_file answers Range / If-None-Match itself and uses wsgi.file_wrapper (or X-Sendfile)
+    return send_from_directory(directory, report.filename, as_attachment=True, conditional=True,
+                               etag=report.checksum, last_modified=report.created_at, max_age=0)
+
 # ---------------------------
-# DB create + default admin
+# DB create + default admin (once per hospital database)
 # ---------------------------
-first_request = True
+initialized_tenants = set()
 
 @app.before_request
 def ensure_db():
-    global first_request
-    if first_request:
-        db.create_all()
+    tenant = current_tenant()
+    if tenant not in initialized_tenants:
+        db.metadata.create_all(bind=tenant_engine(db, tenant))
+        ensure_search_index(tenant_engine(db, tenant))
         # create default admin if missing
         if not User.query.filter_by(role='admin').first():
             admin = User(
@@ -86,12 +284,21 @@ def ensure_db():
             )
             db.session.add(admin)
             db.session.commit()
-        os.makedirs(REPORTS_DIR, exist_ok=True)
-        first_request = False
+        sync_report_catalog()
+        backfill_reminders(db.session)
+        initialized_tenants.add(tenant)
 
 # ---------------------------
 # Helpers
 # ---------------------------
+@app.errorhandler(OperationalError)
+def database_busy(e):
+    # don't park the worker on a SQLite writer lock; tell the client to retry
+    db.session.rollback()
+    if 'locked' in str(e.orig).lower():
+        return jsonify({"category": "danger", "message": "Server busy, please retry shortly"}), 503, {"Retry-After": "1"}
+    raise e
+
 def is_admin_claims(claims):
     return claims.get('role') == 'admin'
 
@@ -106,7 +313,7 @@ def is_patient_claims(claims):
 # ---------------------------
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template(asset_template())
 
 # ---------------------------
 # AUTH: register / login
@@ -159,7 +366,7 @@ def login():
         profile = DoctorProfile.query.filter_by(user_id=user.id).first()
         redirect = 'doctor_profile' if not profile else 'doctor_dashboard'
 
-    token = create_access_token(identity=user.username, additional_claims={"user_id": user.id, "role": user.role, "redirect": redirect})
+    token = create_access_token(identity=user.username, additional_claims={"user_id": user.id, "role": user.role, "redirect": redirect, "tenant": current_tenant()})
     return jsonify({"access_token": token}), 200
 
 @app.route('/get-claims', methods=['GET'])
@@ -180,7 +387,7 @@ def admin_login():
     user = User.query.filter_by(username=username, role='admin').first()
     if not user or not check_password_hash(user.password, password):
         return jsonify({"category": "danger", "message": "Bad username or password"}), 401
-    token = create_access_token(identity=user.username, additional_claims={"admin_user_id": user.id, "role": 'admin'})
+    token = create_access_token(identity=user.username, additional_claims={"admin_user_id": user.id, "role": 'admin', "tenant": current_tenant()})
     return jsonify({"access_token": token}), 200
 
 # ---------------------------
@@ -340,7 +547,8 @@ def export_service_requests(professional_id):
     claims = get_jwt()
     if not is_admin_claims(claims):
         return jsonify({"message": "Admin only"}), 401
-    task = export_professional_service_requests.delay(professional_id)
+    task = export_professional_service_requests.apply_async(args=[professional_id, claims.get('admin_user_id')],
+                                                            priority=PRIORITY_NORMAL)
     return jsonify({"message": f"Export started for professional ID {professional_id}.", "task_id": task.id}), 202
 
 @app.route('/admin/reports/list', methods=['GET'])
@@ -349,9 +557,17 @@ def list_reports():
     claims = get_jwt()
     if not is_admin_claims(claims):
         return jsonify({"message": "Admin only"}), 401
-    os.makedirs(REPORTS_DIR, exist_ok=True)
-    files = [f for f in os.listdir(REPORTS_DIR) if f.endswith('.csv')]
-    return jsonify({"downloads": files}), 200
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 200)
+    result = Report.query.order_by(Report.created_at.desc())\
+                         .paginate(page=page, per_page=per_page, error_out=False)
+    return jsonify({
+        "downloads": [r.filename for r in result.items],
+        "reports": [r.as_dict() for r in result.items],
+        "page": result.page,
+        "pages": result.pages,
+        "total": result.total
+    }), 200
 
 @app.route('/admin/reports/download/<filename>', methods=['GET'])
 @jwt_required()
@@ -359,7 +575,48 @@ def download_report(filename):
     claims = get_jwt()
     if not is_admin_claims(claims):
         return jsonify({"message": "Admin only"}), 401
-    return send_from_directory(REPORTS_DIR, filename, as_attachment=True)
+    report = Report.query.filter_by(filename=filename).first()
+    if not report:
+        return jsonify({"message": "report not found"}), 404
+    return send_report(report)
+
+@app.route('/admin/audit', methods=['GET'])
+@jwt_required()
+def admin_audit_log():
+    claims = get_jwt()
+    if not is_admin_claims(claims):
+        return jsonify({"message": "Admin only"}), 401
+    if app.config['AUDIT_SINK'] != 'database':
+        return jsonify({"message": "Audit log is written to JSONL segments on this server"}), 404
+    try:
+        since = DateTime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = DateTime.fromisoformat(request.args['until']) if request.args.get('until') else None
+    except ValueError:
+        return jsonify({"message": "since/until must be ISO timestamps"}), 400
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 200)
+
+    q = AuditLog.query
+    if request.args.get('entity'):
+        q = q.filter(AuditLog.entity == request.args['entity'])
+    if request.args.get('entity_id', type=int) is not None:
+        q = q.filter(AuditLog.entity_id == request.args.get('entity_id', type=int))
+    if request.args.get('actor_id', type=int) is not None:
+        q = q.filter(AuditLog.actor_id == request.args.get('actor_id', type=int))
+    if request.args.get('action'):
+        q = q.filter(AuditLog.action == request.args['action'])
+    if since:
+        q = q.filter(AuditLog.created_at >= since)
+    if until:
+        q = q.filter(AuditLog.created_at < until)
+    result = q.order_by(AuditLog.created_at.desc(), AuditLog.id.desc())\
+              .paginate(page=page, per_page=per_page, error_out=False)
+    return jsonify({
+        "entries": [e.as_dict() for e in result.items],
+        "page": result.page,
+        "pages": result.pages,
+        "total": result.total
+    }), 200
 
 # ---------------------------
 # DOCTOR endpoints
@@ -414,6 +671,20 @@ def doctor_appointments():
         })
     return jsonify(result), 200
 
+@app.route('/doctor/treatments/search', methods=['GET'])
+@jwt_required()
+def doctor_search_treatments():
+    claims = get_jwt()
+    if not is_doctor_claims(claims):
+        return jsonify({"message": "Doctor only"}), 401
+    if not supports_search(tenant_engine(db)):
+        return jsonify({"message": "search not available on this database"}), 501
+    q = request.args.get('q', '', type=str)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = max(min(request.args.get('per_page', 20, type=int), 100), 1)
+    results, total = search_treatments(db.session, claims['user_id'], q, page, per_page)
+    return jsonify({"results": results, "page": page, "per_page": per_page, "total": total}), 200
+
 @app.route('/doctor/appointments/<int:appointment_id>/complete', methods=['POST'])
 @jwt_required()
 def doctor_complete_appointment(appointment_id):
@@ -437,13 +708,9 @@ def doctor_complete_appointment(appointment_id):
     db.session.add(treatment)
     db.session.commit()
 
-    # optional: notify patient by email if patient.username is an email
+    # notify patient by email off the request path; SMTP can take seconds
     try:
-        patient_user = User.query.get(appt.patient_id)
-        if patient_user and '@' in patient_user.username:
-            msg = Message(subject="Your visit summary", recipients=[patient_user.username],
-                          body=f"Your appointment on {appt.date} with doctor id {appt.doctor_id} is completed.\nDiagnosis: {diagnosis}\nPrescription: {prescription}")
-            mail.send(msg)
+        send_visit_summary.apply_async(args=[treatment.id], priority=PRIORITY_HIGH)
     except Exception:
         pass
 
@@ -501,6 +768,20 @@ def patient_doctors():
     docs = query.all()
     return jsonify([d.as_dict() for d in docs]), 200
 
+@app.route('/patient/recommendations', methods=['GET'])
+@jwt_required()
+def patient_recommendations():
+    claims = get_jwt()
+    if not is_patient_claims(claims):
+        return jsonify({"message": "Patient only"}), 401
+    department_id = request.args.get('department_id', type=int)
+    if not department_id:
+        return jsonify({"message": "department_id required"}), 400
+    days = min(max(request.args.get('days', 7, type=int), 1), 30)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    slots = recommend_slots(db.session, department_id, days, limit, app.config['BOOKING_HOURS'])
+    return jsonify({"department_id": department_id, "slots": slots}), 200
+
 @app.route('/patient/appointments/book', methods=['POST'])
 @jwt_required()
 def patient_book_appointment():
@@ -609,69 +890,180 @@ def patient_export_treatments():
     if not is_patient_claims(claims):
         return jsonify({"message": "Patient only"}), 401
     patient_id = claims['user_id']
-    task = export_treatments_csv.delay(patient_id)
+    # patients wait on this one, so it jumps ahead of admin exports
+    task = export_treatments_csv.apply_async(args=[patient_id], priority=PRIORITY_HIGH)
     return jsonify({"task_id": task.id}), 202
 
 
 @app.route('/reports/download/<path:filename>', methods=['GET'])
 @jwt_required()
 def reports_download(filename):
-    return send_from_directory(REPORTS_DIR, filename, as_attachment=True)
+    claims = get_jwt()
+    report = Report.query.filter_by(filename=filename).first()
+    if not report:
+        return jsonify({"message": "report not found"}), 404
+    if not is_admin_claims(claims) and report.owner_id != claims.get('user_id'):
+        return jsonify({"message": "Not your report"}), 401
+    return send_report(report)
+
+
+# ---------------------------
+# CHANGE FEED (deltas for dashboards)
+# ---------------------------
+CHANGES_REPLAY_LIMIT = 1000
+
+@app.route('/changes', methods=['GET'])
+@jwt_required()
+def changes():
+    claims = get_jwt()
+    since = request.args.get('since', 0, type=int)
+    limit = min(request.args.get('limit', 500, type=int), 1000)
+    rows = scope_query(ChangeLog.query.filter(ChangeLog.id > since), claims)\
+        .order_by(ChangeLog.id.asc()).limit(limit).all()
+    cursor = rows[-1].id if rows else since
+    return jsonify({"changes": [r.as_dict() for r in rows], "cursor": cursor, "has_more": len(rows) == limit}), 200
+
+
+@app.route('/changes/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def changes_stream():
+    claims = get_jwt()
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+
+    # subscribe before replaying so nothing committed in between is lost;
+    # event_stream drops live entries already covered by the replay
+    sub = changefeed_broker.subscribe()
+    replay, partial = [], False
+    if since is not None:
+        rows = scope_query(ChangeLog.query.filter(ChangeLog.id > since), claims)\
+            .order_by(ChangeLog.id.asc()).limit(CHANGES_REPLAY_LIMIT).all()
+        replay = [entry_from_row(r) for r in rows]
+        # too far behind: send this page and end the stream, the browser
+        # reconnects with the last id it got and receives the next page
+        partial = len(rows) == CHANGES_REPLAY_LIMIT
+    return Response(event_stream(sub, claims, replay, partial), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 # ---------------------------
 # CELERY tasks
 # ---------------------------
 
-@celery.task(name="tasks.daily_reminder")
-def daily_reminder():
-    today = DateTime.now().date()
-    appts = Appointment.query.filter_by(date=today, status='Booked').all()
-    for a in appts:
-        patient = User.query.get(a.patient_id)
-        doctor = User.query.get(a.doctor_id)
-        if patient and '@' in patient.username:
-            try:
-                msg = Message(
-                    subject="Appointment Reminder",
-                    recipients=[patient.username],
-                    body=f"Reminder: Appointment with Dr {doctor.username if doctor else 'N/A'} "
-                         f"at {a.time} on {a.date}"
-                )
-                mail.send(msg)
-            except Exception:
-                pass
-    return "done"
-
-
-@celery.task(name="tasks.monthly_doctor_activity")
+@celery.task(name="tasks.dispatch_due_reminders", soft_time_limit=50, time_limit=60)
+def dispatch_due_reminders():
+    if explicit_tenant() is None and len(known_tenants(app)) > 1:
+        return fan_out_tenants(dispatch_due_reminders)
+    now = DateTime.now()
+    ids = claim_due_reminders(db.session, now)
+    batches = [ids[i:i + REMINDER_BATCH_SIZE] for i in range(0, len(ids), REMINDER_BATCH_SIZE)]
+    published = 0
+    try:
+        for batch in batches:
+            send_reminder_batch.apply_async((batch,), priority=PRIORITY_HIGH)
+            published += 1
+    except Exception:
+        release_reminders(db.session, [i for batch in batches[published:] for i in batch], now)
+        raise
+    return f"queued {len(ids)} reminders in {len(batches)} batches"
+
+
+# rate limit is per batch: 10 batches/min * 50 mails keeps the SMTP relay at ~500/min
+@celery.task(name="tasks.send_reminder_batch", rate_limit='10/m', soft_time_limit=120, time_limit=180)
+def send_reminder_batch(appointment_ids):
+    appts = Appointment.query.filter(Appointment.id.in_(appointment_ids), Appointment.status == 'Booked').all()
+    sent = 0
+    with mail.connect() as conn:
+        for a in appts:
+            patient = User.query.get(a.patient_id)
+            doctor = User.query.get(a.doctor_id)
+            if patient and '@' in patient.username:
+                try:
+                    msg = Message(
+                        subject="Appointment Reminder",
+                        recipients=[patient.username],
+                        body=f"Reminder: Appointment with Dr {doctor.username if doctor else 'N/A'} "
+                             f"at {a.time} on {a.date}"
+                    )
+                    conn.send(msg)
+                    sent += 1
+                except Exception:
+                    pass
+    return sent
+
+
+@celery.task(name="tasks.send_visit_summary", rate_limit='60/m', soft_time_limit=30, time_limit=60)
+def send_visit_summary(treatment_id):
+    t = Treatment.query.get(treatment_id)
+    appt = Appointment.query.get(t.appointment_id) if t else None
+    patient_user = User.query.get(appt.patient_id) if appt else None
+    if not patient_user or '@' not in patient_user.username:
+        return False
+    try:
+        msg = Message(subject="Your visit summary", recipients=[patient_user.username],
+                      body=f"Your appointment on {appt.date} with doctor id {appt.doctor_id} is completed.\nDiagnosis: {t.diagnosis}\nPrescription: {t.prescription}")
+        mail.send(msg)
+        return True
+    except Exception:
+        return False
+
+
+@celery.task(name="tasks.monthly_doctor_activity", soft_time_limit=60, time_limit=120)
 def monthly_doctor_activity():
-    doctors = User.query.filter_by(role='doctor', approve=True).all()
+    if explicit_tenant() is None and len(known_tenants(app)) > 1:
+        return fan_out_tenants(monthly_doctor_activity)
+    doctor_ids = [d.id for d in User.query.with_entities(User.id).filter_by(role='doctor', approve=True).all()]
+    if not doctor_ids:
+        return "done"
+    chord(
+        doctor_activity_report.s(doctor_id).set(priority=PRIORITY_LOW) for doctor_id in doctor_ids
+    )(monthly_activity_summary.s().set(priority=PRIORITY_LOW))
+    return f"queued {len(doctor_ids)} doctor reports"
+
+
+@celery.task(name="tasks.doctor_activity_report", rate_limit='30/m', soft_time_limit=120, time_limit=180)
+def doctor_activity_report(doctor_id):
+    d = User.query.get(doctor_id)
+    if not d:
+        return False
     now = DateTime.now()
     month = now.month
-    for d in doctors:
-        appts = Appointment.query.filter(
-            Appointment.doctor_id == d.id,
-            func.strftime('%m', Appointment.date) == f"{month:02d}"
-        ).all()
-        html = f"<h2>Activity for {d.username} - {now.strftime('%B %Y')}</h2><ul>"
-        for a in appts:
-            html += f"<li>{a.date} {a.time} - {a.status}</li>"
-        html += "</ul>"
-        if '@' in d.username:
-            try:
-                msg = Message(
-                    subject=f"Monthly Activity - {now.strftime('%B %Y')}",
-                    recipients=[d.username],
-                    html=html
-                )
-                mail.send(msg)
-            except Exception:
-                pass
-    return "done"
-
-
-@celery.task(name="tasks.export_treatments_csv")
+    appts = Appointment.query.filter(
+        Appointment.doctor_id == d.id,
+        func.strftime('%m', Appointment.date) == f"{month:02d}"
+    ).all()
+    html = f"<h2>Activity for {d.username} - {now.strftime('%B %Y')}</h2><ul>"
+    for a in appts:
+        html += f"<li>{a.date} {a.time} - {a.status}</li>"
+    html += "</ul>"
+    if '@' in d.username:
+        try:
+            msg = Message(
+                subject=f"Monthly Activity - {now.strftime('%B %Y')}",
+                recipients=[d.username],
+                html=html
+            )
+            mail.send(msg)
+            return True
+        except Exception:
+            pass
+    return False
+
+
+@celery.task(name="tasks.monthly_activity_summary")
+def monthly_activity_summary(results):
+    return f"sent {sum(1 for r in results if r)} of {len(results)} doctor reports"
+
+
+@celery.task(name="tasks.compute_utilization", soft_time_limit=1800, time_limit=1900)
+def compute_utilization_task():
+    if explicit_tenant() is None and len(known_tenants(app)) > 1:
+        return fan_out_tenants(compute_utilization_task)
+    return compute_utilization(db.session, app.config['UTILIZATION_HISTORY_WEEKS'])
+
+
+@celery.task(name="tasks.export_treatments_csv", soft_time_limit=300, time_limit=360)
 def export_treatments_csv(patient_id):
     treatments = Treatment.query.join(Appointment).filter(Appointment.patient_id == patient_id).all()
     output = StringIO()
@@ -687,32 +1079,30 @@ def export_treatments_csv(patient_id):
             t.prescription,
             t.notes
         ])
-    os.makedirs(REPORTS_DIR, exist_ok=True)
-    path = os.path.join(REPORTS_DIR, f"patient_{patient_id}_treatments.csv")
-    with open(path, 'w', newline='') as f:
-        f.write(output.getvalue())
-    return path
+    return save_report(f"patient_{patient_id}_treatments.csv", 'patient_treatments', patient_id,
+                       output.getvalue(), len(treatments))
 
 
-@celery.task(name="tasks.export_professional_service_requests")
-def export_professional_service_requests(professional_id):
+@celery.task(name="tasks.export_professional_service_requests", soft_time_limit=600, time_limit=660)
+def export_professional_service_requests(professional_id, requested_by=None):
     appts = Appointment.query.filter_by(doctor_id=professional_id).all()
     output = StringIO()
     writer = csv.writer(output)
     writer.writerow(['appointment_id', 'patient_id', 'date', 'time', 'status', 'remarks'])
     for a in appts:
         writer.writerow([a.id, a.patient_id, a.date, a.time, a.status, a.remarks])
-    os.makedirs(REPORTS_DIR, exist_ok=True)
-    path = os.path.join(REPORTS_DIR, f"doctor_{professional_id}_appointments.csv")
-    with open(path, 'w', newline='') as f:
-        f.write(output.getvalue())
-    return path
+    return save_report(f"doctor_{professional_id}_appointments.csv", 'doctor_appointments', requested_by,
+                       output.getvalue(), len(appts))
 
 
 celery.conf.beat_schedule = {
-    'daily-reminder': {
-        'task': 'tasks.daily_reminder',
-        'schedule': crontab(hour=8, minute=0)
+    'dispatch-due-reminders': {
+        'task': 'tasks.dispatch_due_reminders',
+        'schedule': crontab(minute='*')
+    },
+    'nightly-utilization': {
+        'task': 'tasks.compute_utilization',
+        'schedule': crontab(hour=2, minute=30)
     },
     'monthly-doctor-activity': {
         'task': 'tasks.monthly_doctor_activity',
@@ -720,6 +1110,42 @@ celery.conf.beat_schedule = {
     },
 }
 
+# ---------------------------
+# CLI
+# ---------------------------
+@app.cli.command('rebuild-search-index')
+@click.option('--tenant', default=None, help='Hospital to rebuild (default: all)')
+def rebuild_search_index_command(tenant):
+    for name in ([tenant] if tenant else known_tenants(app)):
+        with tenant_context(name):
+            engine = tenant_engine(db, name)
+            if not supports_search(engine):
+                click.echo(f"{name}: skipped (not SQLite)")
+                continue
+            db.metadata.create_all(bind=engine)
+            click.echo(f"{name}: indexed {rebuild_search_index(engine)} treatments")
+
+@app.cli.command('import-data')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--kind', type=click.Choice(IMPORT_KINDS), required=True,
+              help='Load doctors and patients first, then appointments, then treatments')
+@click.option('--tenant', default=DEFAULT_TENANT, help='Hospital to import into')
+@click.option('--batch-size', default=5000, show_default=True)
+@click.option('--workers', default=None, type=int, help='Password hashing processes (default: CPU count)')
+@click.option('--restart', is_flag=True, help='Ignore the saved progress and start from the first line')
+def import_data_command(path, kind, tenant, batch_size, workers, restart):
+    if tenant not in known_tenants(app):
+        raise click.BadParameter(f"unknown hospital {tenant!r}", param_hint='--tenant')
+    with tenant_context(tenant):
+        engine = tenant_engine(db, tenant)
+        db.metadata.create_all(bind=engine)
+        ensure_search_index(engine)
+        stats = run_import(db.session, path, kind, batch_size, workers, restart, echo=click.echo)
+        if kind == 'appointments':
+            # bulk inserts skip the ORM hooks, so schedule reminders for future bookings here
+            click.echo(f"scheduled {backfill_reminders(db.session)} reminders")
+    click.echo(f"done: {stats['inserted']} inserted, {stats['skipped']} skipped, {stats['rejected']} rejected")
+
 # ---------------------------
 # Run
 # ---------------------------
@@ -0,0 +1,118 @@
+from datetime import datetime as DateTime, timedelta
+from sqlalchemy import event, select, update, delete, inspect
+from sqlalchemy.orm import Session
+from models import Appointment, Reminder
+
+# ---------------------------
+# Reminder scheduling
+# ---------------------------
+# Each booked appointment owns one Reminder row due REMINDER_OFFSET_MINUTES
+# before it starts. Bookings, reschedules and cancellations update that row in
+# the same flush, and a once-a-minute beat task claims whatever has come due,
+# so mail goes out in small batches across the day rather than one 08:00 burst.
+
+REMINDER_FIELDS = ('date', 'time', 'status')
+
+offset = timedelta(minutes=120)
+
+
+def due_time(appt, now=None):
+    if not appt.date or not appt.time:
+        return None
+    due = DateTime.combine(appt.date, appt.time) - offset
+    now = now or DateTime.now()
+    # booked inside the offset window: remind on the next tick
+    return max(due, now) if DateTime.combine(appt.date, appt.time) > now else None
+
+
+def _changed(appt):
+    state = inspect(appt)
+    return any(state.attrs[field].history.has_changes() for field in REMINDER_FIELDS)
+
+
+def _sync_reminders(session, flush_context):
+    # new bookings can't have a reminder yet: one executemany for all of them
+    fresh = [
+        {"appointment_id": obj.id, "due_at": due} for obj in session.new
+        if isinstance(obj, Appointment) and obj.status == 'Booked' and (due := due_time(obj))
+    ]
+    if fresh:
+        session.connection().execute(Reminder.__table__.insert(), fresh)
+
+    conn = None
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Appointment):
+            continue
+        if obj not in session.deleted and not _changed(obj):
+            continue
+        conn = conn or session.connection()
+        if obj in session.deleted:
+            conn.execute(delete(Reminder).where(Reminder.appointment_id == obj.id))
+            continue
+        due = due_time(obj) if obj.status == 'Booked' else None
+
+        if due is None:
+            # cancelled, completed or already past: drop the unsent reminder
+            conn.execute(delete(Reminder).where(Reminder.appointment_id == obj.id, Reminder.sent_at.is_(None)))
+            continue
+        existing = conn.execute(select(Reminder.id, Reminder.due_at).where(Reminder.appointment_id == obj.id)).first()
+        if existing is None:
+            conn.execute(Reminder.__table__.insert().values(appointment_id=obj.id, due_at=due))
+        elif existing.due_at != due:
+            # rescheduled: re-arm it even if the old slot's reminder already went out
+            conn.execute(update(Reminder).where(Reminder.id == existing.id).values(due_at=due, sent_at=None))
+
+
+def backfill_reminders(session, now=None):
+    now = now or DateTime.now()
+    scheduled = select(Reminder.appointment_id)
+    appts = Appointment.query.filter(
+        Appointment.status == 'Booked',
+        Appointment.date >= now.date(),
+        Appointment.id.not_in(scheduled)
+    ).all()
+    rows = [{"appointment_id": a.id, "due_at": due} for a in appts if (due := due_time(a, now))]
+    if rows:
+        session.execute(Reminder.__table__.insert(), rows)
+        session.commit()
+    return len(rows)
+
+
+def claim_due_reminders(session, now=None, limit=5000):
+    now = now or DateTime.now()
+    rows = session.execute(
+        select(Reminder.id, Reminder.appointment_id)
+        .where(Reminder.sent_at.is_(None), Reminder.due_at <= now)
+        .order_by(Reminder.due_at)
+        .limit(limit)
+    ).all()
+    if not rows:
+        return []
+    # the sent_at IS NULL guard makes overlapping dispatcher runs claim each row once
+    session.execute(
+        update(Reminder)
+        .where(Reminder.id.in_([r.id for r in rows]), Reminder.sent_at.is_(None))
+        .values(sent_at=now)
+    )
+    session.commit()
+    claimed = session.execute(
+        select(Reminder.appointment_id).where(Reminder.id.in_([r.id for r in rows]), Reminder.sent_at == now)
+    ).scalars().all()
+    return list(claimed)
+
+
+def release_reminders(session, appointment_ids, claimed_at):
+    # the broker refused the sends: un-claim them so the next tick retries
+    if appointment_ids:
+        session.execute(
+            update(Reminder)
+            .where(Reminder.appointment_id.in_(appointment_ids), Reminder.sent_at == claimed_at)
+            .values(sent_at=None)
+        )
+        session.commit()
+
+
+def init_reminders(app):
+    global offset
+    offset = timedelta(minutes=app.config.get('REMINDER_OFFSET_MINUTES', 120))
+    event.listen(Session, 'after_flush', _sync_reminders)
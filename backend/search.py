@@ -0,0 +1,137 @@
+import html
+from sqlalchemy import text
+
+# ---------------------------
+# Clinical search (SQLite FTS5)
+# ---------------------------
+# treatments_fts is an external-content FTS5 index over treatments; the
+# triggers below keep it in step with every insert/update/delete, including
+# bulk executemany loads, so the ORM code never has to know it exists.
+
+FTS_TABLE = 'treatments_fts'
+
+SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        diagnosis, prescription, notes,
+        content='treatments', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS treatments_fts_ai AFTER INSERT ON treatments BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, diagnosis, prescription, notes)
+        VALUES (new.id, new.diagnosis, new.prescription, new.notes);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS treatments_fts_ad AFTER DELETE ON treatments BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, diagnosis, prescription, notes)
+        VALUES ('delete', old.id, old.diagnosis, old.prescription, old.notes);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS treatments_fts_au AFTER UPDATE ON treatments BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, diagnosis, prescription, notes)
+        VALUES ('delete', old.id, old.diagnosis, old.prescription, old.notes);
+        INSERT INTO {FTS_TABLE}(rowid, diagnosis, prescription, notes)
+        VALUES (new.id, new.diagnosis, new.prescription, new.notes);
+    END""",
+    # DOCTOR_TREATMENTS below
+    "CREATE INDEX IF NOT EXISTS ix_appointments_doctor ON appointments(doctor_id)",
+    "CREATE INDEX IF NOT EXISTS ix_treatments_appointment ON treatments(appointment_id)",
+]
+
+# column weights for bm25(): a hit in the diagnosis counts most
+RANK = f"bm25({FTS_TABLE}, 3.0, 2.0, 1.0)"
+# private-use markers survive html.escape, then become <mark> tags
+HL_START, HL_END = '\ue000', '\ue001'
+
+
+def _snippet(column):
+    return f"snippet({FTS_TABLE}, {column}, '{HL_START}', '{HL_END}', '…', 12)"
+
+
+# The doctor's treatments, to filter the term's matches against. FTS5 has to
+# drive both queries: probed by rowid, it re-runs the MATCH for every row,
+# which is far slower for common and prefix terms (bench_search.py). The
+# unary + keeps SQLite from turning the IN list into such probes, so it is
+# built once and every match is checked against it before it is ranked.
+DOCTOR_TREATMENTS = f"""
+    +{FTS_TABLE}.rowid IN (SELECT dt.id FROM appointments da
+                           JOIN treatments dt ON dt.appointment_id = da.id
+                           WHERE da.doctor_id = :doctor_id)
+"""
+
+SEARCH_SQL = f"""
+    SELECT t.id AS treatment_id, t.appointment_id, a.patient_id, a.date,
+           {_snippet(0)} AS diagnosis, {_snippet(1)} AS prescription, {_snippet(2)} AS notes,
+           {RANK} AS rank
+    FROM {FTS_TABLE}
+    JOIN treatments t ON t.id = {FTS_TABLE}.rowid
+    JOIN appointments a ON a.id = t.appointment_id
+    WHERE {FTS_TABLE} MATCH :query AND {DOCTOR_TREATMENTS}
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+"""
+
+COUNT_SQL = f"""
+    SELECT count(*)
+    FROM {FTS_TABLE}
+    WHERE {FTS_TABLE} MATCH :query AND {DOCTOR_TREATMENTS}
+"""
+
+
+def supports_search(engine):
+    return engine.dialect.name == 'sqlite'
+
+
+def ensure_search_index(engine):
+    if not supports_search(engine):
+        return False
+    with engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": FTS_TABLE}).first()
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        if not exists:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    return True
+
+
+def rebuild_search_index(engine):
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+        return conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+
+
+def to_match_query(q):
+    # quote every term so user input can't inject FTS operators; a trailing *
+    # stays a prefix search ("metf*")
+    terms = []
+    for term in (q or '').split():
+        prefix = term.endswith('*')
+        term = term.rstrip('*').replace('"', '""')
+        if term:
+            terms.append(f'"{term}"*' if prefix else f'"{term}"')
+    return ' '.join(terms)
+
+
+def _highlight(value):
+    if value is None:
+        return None
+    return html.escape(value).replace(HL_START, '<mark>').replace(HL_END, '</mark>')
+
+
+def search_treatments(session, doctor_id, q, page=1, per_page=20):
+    query = to_match_query(q)
+    if not query:
+        return [], 0
+    params = {"query": query, "doctor_id": doctor_id, "limit": per_page, "offset": (page - 1) * per_page}
+    rows = session.execute(text(SEARCH_SQL), params).mappings().all()
+    total = session.execute(text(COUNT_SQL), params).scalar()
+    return [{
+        "treatment_id": r["treatment_id"],
+        "appointment_id": r["appointment_id"],
+        "patient_id": r["patient_id"],
+        "appointment_date": str(r["date"]) if r["date"] else None,
+        "diagnosis": _highlight(r["diagnosis"]),
+        "prescription": _highlight(r["prescription"]),
+        "notes": _highlight(r["notes"]),
+        "rank": r["rank"],
+    } for r in rows], total
@@ -0,0 +1,120 @@
+import contextvars
+from contextlib import contextmanager
+from flask import g, request, jsonify
+from flask_sqlalchemy.session import Session as FlaskSession
+from flask_jwt_extended import verify_jwt_in_request, get_jwt
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ---------------------------
+# Multi-hospital tenancy
+# ---------------------------
+# Each hospital (tenant) gets its own database file and engine, so writers in
+# one hospital never wait on another hospital's SQLite lock. The tenant comes
+# from the "tenant" JWT claim (or X-Tenant / {"tenant": ...} before login) and
+# is kept in a context variable that TenantSession.get_bind reads.
+
+DEFAULT_TENANT = 'default'
+BIND_PREFIX = 'tenant:'
+
+_current_tenant = contextvars.ContextVar('tenant', default=None)
+
+
+def current_tenant():
+    return _current_tenant.get() or DEFAULT_TENANT
+
+
+def explicit_tenant():
+    # None outside a request/task that named a tenant (e.g. beat-scheduled runs)
+    return _current_tenant.get()
+
+
+@contextmanager
+def tenant_context(tenant):
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+
+
+def tenant_bind_key(tenant):
+    return None if tenant in (None, DEFAULT_TENANT) else BIND_PREFIX + tenant
+
+
+class TenantSession(FlaskSession):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            key = tenant_bind_key(_current_tenant.get())
+            if key is not None:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def parse_tenants(value):
+    # "north=sqlite:///north.db,south=sqlite:///south.db"
+    tenants = {}
+    for part in (value or '').split(','):
+        name, _, uri = part.strip().partition('=')
+        if name and uri:
+            tenants[name.strip()] = uri.strip()
+    return tenants
+
+
+def configure_tenants(app):
+    tenants = app.config.setdefault('TENANT_DATABASES', {})
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for name, uri in tenants.items():
+        binds[BIND_PREFIX + name] = uri
+
+
+def known_tenants(app):
+    return [DEFAULT_TENANT] + list(app.config.get('TENANT_DATABASES', {}))
+
+
+def tenant_engine(db, tenant=None):
+    return db.engines[tenant_bind_key(tenant or current_tenant())]
+
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a tenant's single writer commits
+    if type(dbapi_connection).__module__.startswith('sqlite3'):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+
+def add_tenant_header(headers=None, **kwargs):
+    # before_task_publish hook: tasks queued from a request run in its tenant
+    tenant = _current_tenant.get()
+    if tenant and headers is not None:
+        headers.setdefault('tenant', tenant)
+
+
+def init_tenancy(app, query_token_endpoints=()):
+    tenants = set(known_tenants(app))
+
+    @app.before_request
+    def select_tenant():
+        tenant = None
+        locations = ['headers', 'query_string'] if request.endpoint in query_token_endpoints else None
+        try:
+            if verify_jwt_in_request(optional=True, locations=locations):
+                tenant = get_jwt().get('tenant')
+        except Exception:
+            # bad tokens are rejected by the route's own @jwt_required
+            pass
+        if tenant is None:
+            data = request.get_json(silent=True) if request.is_json else None
+            tenant = request.headers.get('X-Tenant') or (data or {}).get('tenant') or DEFAULT_TENANT
+        if tenant not in tenants:
+            return jsonify({"category": "danger", "message": "Unknown hospital"}), 400
+        g.tenant_token = _current_tenant.set(tenant)
+
+    @app.teardown_request
+    def reset_tenant(exc=None):
+        token = g.pop('tenant_token', None)
+        if token is not None:
+            _current_tenant.reset(token)
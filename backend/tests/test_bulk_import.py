@@ -0,0 +1,79 @@
+import json
+
+import pytest
+from flask import Flask
+
+from models import db, User, PatientProfile, Appointment
+from bulk_import import run_import
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'import.db')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def write_jsonl(path, records):
+    path.write_text(''.join(json.dumps(r) + '\n' for r in records), encoding='utf-8')
+    return str(path)
+
+
+def rejects(path):
+    with open(path + '.rejects.jsonl', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_non_string_fields_are_coerced_or_rejected(app, tmp_path):
+    path = write_jsonl(tmp_path / 'patients.jsonl', [
+        {"username": "a@x.com", "password": 12345, "contact": 5551234},
+        {"username": ["b@x.com"], "password": "pw"},
+        {"username": "c@x.com", "password": {"plain": "pw"}},
+        {"username": "d@x.com", "password": "pw", "address": {"street": "Main"}},
+        {"username": "e@x.com", "password": "pw"},
+    ])
+    stats = run_import(db.session, path, 'patients', batch_size=10, workers=1, echo=lambda msg: None)
+
+    assert stats == {"inserted": 2, "skipped": 0, "rejected": 3}
+    assert {u.username for u in User.query} == {"a@x.com", "e@x.com"}
+    assert PatientProfile.query.join(User, User.id == PatientProfile.user_id).filter(
+        User.username == "a@x.com").one().contact == "5551234"
+    assert [(r['line'], r['error']) for r in rejects(path)] == [
+        (2, "username must be text"), (3, "password must be text"), (4, "address must be text")]
+
+
+def test_rerun_after_bad_rows_continues(app, tmp_path):
+    path = write_jsonl(tmp_path / 'patients.jsonl', [
+        {"username": "a@x.com", "password": ["x"]},
+        {"username": "b@x.com", "password": "pw"},
+    ])
+    run_import(db.session, path, 'patients', batch_size=1, workers=1, echo=lambda msg: None)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({"username": "c@x.com", "password": "pw"}) + '\n')
+    stats = run_import(db.session, path, 'patients', batch_size=1, workers=1, echo=lambda msg: None)
+
+    assert stats == {"inserted": 1, "skipped": 0, "rejected": 0}
+    assert {u.username for u in User.query} == {"b@x.com", "c@x.com"}
+
+
+def test_appointment_with_non_string_status_is_rejected(app, tmp_path):
+    people = write_jsonl(tmp_path / 'doctors.jsonl', [{"username": "doc@x.com", "password": "pw"}])
+    run_import(db.session, people, 'doctors', workers=1, echo=lambda msg: None)
+    people = write_jsonl(tmp_path / 'patients.jsonl', [{"username": "pat@x.com", "password": "pw"}])
+    run_import(db.session, people, 'patients', workers=1, echo=lambda msg: None)
+
+    path = write_jsonl(tmp_path / 'appointments.jsonl', [
+        {"patient": "pat@x.com", "doctor": "doc@x.com", "date": "2027-01-04", "time": "09:00", "status": 1},
+        {"patient": "pat@x.com", "doctor": "doc@x.com", "date": "2027-01-04", "time": "09:00",
+         "remarks": ["follow", "up"]},
+        {"patient": "pat@x.com", "doctor": "doc@x.com", "date": "2027-01-04", "time": "09:00"},
+    ])
+    stats = run_import(db.session, path, 'appointments', workers=1, echo=lambda msg: None)
+
+    # the rejected rows must not hold the slot against the valid one
+    assert stats == {"inserted": 1, "skipped": 0, "rejected": 2}
+    assert Appointment.query.count() == 1
@@ -0,0 +1,125 @@
+import queue
+import time
+
+import redis
+
+from changefeed import RedisBroker
+
+DOWN = object()
+
+
+class FakeConnection:
+    def __init__(self):
+        self.callbacks = []
+
+    def register_connect_callback(self, callback):
+        self.callbacks.append(callback)
+
+
+class FakePubSub:
+    def __init__(self, server):
+        self.server = server
+        self.connection = None
+        self.messages = queue.Queue()
+
+    def subscribe(self, channel):
+        if not self.server.up:
+            raise redis.ConnectionError("connection refused")
+        self.connection = FakeConnection()
+        self.server.listeners.append(self)
+
+    def listen(self):
+        while True:
+            message = self.messages.get()
+            if message is DOWN:
+                raise redis.ConnectionError("connection reset")
+            yield message
+
+    def close(self):
+        if self in self.server.listeners:
+            self.server.listeners.remove(self)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.up = True
+        self.listeners = []
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+    def publish(self, channel, data):
+        if not self.up:
+            raise redis.ConnectionError("connection refused")
+        for pubsub in list(self.listeners):
+            pubsub.messages.put({"data": data})
+
+    def go_down(self):
+        self.up = False
+        for pubsub in list(self.listeners):
+            pubsub.messages.put(DOWN)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def entry(cursor):
+    return [{"cursor": cursor}]
+
+
+def test_publish_reaches_subscribers_through_redis():
+    broker = RedisBroker(FakeRedis(), retry_interval=0.05)
+    sub = broker.subscribe()
+    assert wait_for(lambda: broker.client.listeners)
+    broker.publish(entry(1))
+    assert sub.queue.get(timeout=1) == entry(1)
+    assert not sub.overflowed
+
+
+def test_publish_failure_ends_streams_and_falls_back_in_process():
+    server = FakeRedis()
+    broker = RedisBroker(server, retry_interval=0.05)
+    old = broker.subscribe()
+    assert wait_for(lambda: server.listeners)
+    server.up = False
+    broker.publish(entry(1))
+    assert old.overflowed
+
+    fresh = broker.subscribe()
+    broker.publish(entry(2))
+    assert fresh.queue.get(timeout=1) == entry(2)
+    assert not fresh.overflowed
+
+
+def test_listener_drop_ends_streams_and_recovers():
+    server = FakeRedis()
+    broker = RedisBroker(server, retry_interval=0.05)
+    old = broker.subscribe()
+    assert wait_for(lambda: server.listeners)
+    server.go_down()
+    assert wait_for(lambda: old.overflowed)
+
+    during = broker.subscribe()
+    server.up = True
+    # coming back also ends the streams opened during the outage, so they replay it
+    assert wait_for(lambda: during.overflowed)
+    after = broker.subscribe()
+    assert wait_for(lambda: server.listeners)
+    broker.publish(entry(3))
+    assert after.queue.get(timeout=1) == entry(3)
+
+
+def test_silent_resubscribe_ends_streams():
+    server = FakeRedis()
+    broker = RedisBroker(server, retry_interval=0.05)
+    sub = broker.subscribe()
+    assert wait_for(lambda: server.listeners)
+    for callback in server.listeners[0].connection.callbacks:
+        callback(server.listeners[0].connection)
+    assert sub.overflowed
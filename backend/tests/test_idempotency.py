@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+import redis
+from flask import Flask, jsonify, request
+
+import idempotency
+from idempotency import init_idempotency, RedisStore, LocalStore
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['IDEMPOTENCY_REDIS_URL'] = None
+    app.calls = 0
+    app.started = threading.Event()
+    app.proceed = threading.Event()
+    app.proceed.set()
+
+    @app.post('/book')
+    def book():
+        app.calls += 1
+        app.started.set()
+        app.proceed.wait(5)
+        return jsonify({"message": "Booked", "call": app.calls}), 201
+
+    @app.post('/flaky')
+    def flaky():
+        app.calls += 1
+        if app.calls == 1:
+            return jsonify({"message": "boom"}), 500
+        return jsonify({"message": "ok"}), 201
+
+    app.store = init_idempotency(app)
+    return app
+
+
+def post(client, path, key, body=None):
+    return client.post(path, json=body or {"slot": "09:00"}, headers={"Idempotency-Key": key})
+
+
+def test_retry_replays_stored_response(app):
+    client = app.test_client()
+    first = post(client, '/book', 'k1')
+    second = post(client, '/book', 'k1')
+    assert first.status_code == second.status_code == 201
+    assert second.get_json() == first.get_json()
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    assert app.calls == 1
+
+
+def test_other_key_runs_again(app):
+    client = app.test_client()
+    post(client, '/book', 'k1')
+    post(client, '/book', 'k2')
+    assert app.calls == 2
+
+
+def test_retry_while_running_gets_409(app):
+    app.proceed.clear()
+    results = {}
+    first = threading.Thread(target=lambda: results.update(first=post(app.test_client(), '/book', 'k1')))
+    first.start()
+    assert app.started.wait(5)
+    retry = post(app.test_client(), '/book', 'k1')
+    app.proceed.set()
+    first.join(5)
+    assert retry.status_code == 409
+    assert retry.headers['Retry-After'] == '1'
+    assert results['first'].status_code == 201
+    assert app.calls == 1
+
+
+def test_same_key_different_body_is_422(app):
+    client = app.test_client()
+    post(client, '/book', 'k1', {"slot": "09:00"})
+    reused = post(client, '/book', 'k1', {"slot": "10:00"})
+    assert reused.status_code == 422
+    assert app.calls == 1
+
+
+def test_5xx_is_released_for_a_real_retry(app):
+    client = app.test_client()
+    assert post(client, '/flaky', 'k1').status_code == 500
+    retry = post(client, '/flaky', 'k1')
+    assert retry.status_code == 201
+    assert 'Idempotent-Replayed' not in retry.headers
+    assert app.calls == 2
+
+
+def test_without_key_is_not_deduplicated(app):
+    client = app.test_client()
+    client.post('/book', json={"slot": "09:00"})
+    client.post('/book', json={"slot": "09:00"})
+    assert app.calls == 2
+
+
+class DownRedis:
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise redis.ConnectionError("connection refused")
+        return fail
+
+
+def test_redis_outage_falls_back_to_local_store(monkeypatch):
+    store = RedisStore(DownRedis(), LocalStore())
+    monkeypatch.setattr(idempotency, 'make_store', lambda url: store)
+    fallback_app = Flask(__name__)
+    calls = []
+
+    @fallback_app.post('/book')
+    def book():
+        calls.append(request.get_json())
+        return jsonify({"message": "Booked"}), 201
+
+    init_idempotency(fallback_app)
+    client = fallback_app.test_client()
+    assert post(client, '/book', 'k1').status_code == 201
+    retry = post(client, '/book', 'k1')
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert len(calls) == 1
@@ -32,7 +32,7 @@ export default {
           v-for="(slide, index) in slides"
           :key="index"
         >
-          <img :src="slide.image" class="d-block w-100" :alt="slide.alt" />
+          <img :src="slide.image" :srcset="srcset(slide.image)" sizes="100vw" class="d-block w-100" :alt="slide.alt" />
           <div class="carousel-caption d-none d-md-block">
             <button @click="navigateTo(slide.link)" class="btn">
               <h5>{{ slide.title }}</h5>
@@ -71,6 +71,11 @@ export default {
     }
   },
   methods: {
+    // built images (/assets/...) have 480/960px copies served via ?w=
+    srcset(src) {
+      if (!src || !src.startsWith("/assets/")) return undefined;
+      return `${src}?w=480 480w, ${src}?w=960 960w, ${src}?w=1920 1920w`;
+    },
     navigateTo(url) {
       this.$router.push(url).catch((error) => {
         console.error("Navigation error:", error);
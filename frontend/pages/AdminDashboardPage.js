@@ -1,3 +1,5 @@
+import { subscribeChanges, applyChange } from "../utils/changefeed.js";
+
 export default {
   template: `
   <div class="container mt-4">
@@ -94,12 +96,33 @@ export default {
   },
 
   mounted() {
+    this.unsubscribe = subscribeChanges(this.onChange, this.refresh);
     this.fetchDoctors();
     this.fetchPatients();
     this.fetchAppointments();
   },
 
+  beforeDestroy() {
+    if (this.unsubscribe) this.unsubscribe();
+  },
+
   methods: {
+    refresh() {
+      this.fetchDoctors();
+      this.fetchPatients();
+      this.fetchAppointments();
+    },
+
+    onChange(change) {
+      if (change.entity === "appointment") {
+        applyChange(this.appointments, change);
+      } else if (change.entity === "user" && change.data.role === "doctor") {
+        applyChange(this.doctors, change);
+      } else if (change.entity === "user" && change.data.role === "patient") {
+        applyChange(this.patients, change);
+      }
+    },
+
     async fetchDoctors() {
       try {
         const res = await fetch(`${location.origin}/admin/doctors`, {
@@ -153,7 +176,7 @@ export default {
         if (!res.ok) throw new Error('Failed to update doctor');
         const data = await res.json();
         console.log(data);
-        this.fetchDoctors();
+        if (!this.unsubscribe.live()) this.fetchDoctors();
       } catch (err) {
         console.error(err);
         alert('Error updating doctor status');
@@ -1,3 +1,5 @@
+import { subscribeChanges, applyChange } from "../utils/changefeed.js";
+
 export default {
   template: `
     <div class="container mt-5">
@@ -75,6 +77,10 @@ export default {
   },
 
   methods: {
+    onChange(change) {
+      if (change.entity === "appointment") applyChange(this.appointments, change);
+    },
+
     async fetchAppointments() {
       this.message = null;
       try {
@@ -105,6 +111,11 @@ export default {
   },
 
   mounted() {
+    this.unsubscribe = subscribeChanges(this.onChange, this.fetchAppointments);
     this.fetchAppointments();
   },
+
+  beforeDestroy() {
+    if (this.unsubscribe) this.unsubscribe();
+  },
 };
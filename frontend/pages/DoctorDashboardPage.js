@@ -1,3 +1,6 @@
+import { subscribeChanges, applyChange } from "../utils/changefeed.js";
+import { fetchIdempotent } from "../utils/idempotency.js";
+
 export default {
   template: `
   <div class="container mt-4">
@@ -60,10 +63,23 @@ export default {
   },
 
   mounted() {
+    this.unsubscribe = subscribeChanges(this.onChange, this.fetchAppointments);
     this.fetchAppointments();
   },
 
+  beforeDestroy() {
+    if (this.unsubscribe) this.unsubscribe();
+  },
+
   methods: {
+    onChange(change) {
+      if (change.entity !== "appointment") return;
+      applyChange(this.appointments, change);
+      if (change.data && !this.patients[change.data.patient_id]) {
+        this.fetchPatients();
+      }
+    },
+
     async fetchAppointments() {
       try {
         const token = localStorage.getItem('token');
@@ -129,7 +145,7 @@ export default {
 
       try {
         const token = localStorage.getItem('token');
-        const res = await fetch(`${location.origin}/doctor/appointments/${appointmentId}/complete`, {
+        const res = await fetchIdempotent(`${location.origin}/doctor/appointments/${appointmentId}/complete`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
@@ -142,7 +158,7 @@ export default {
         if (res.ok) {
           this.message = data.message || "Appointment marked as completed.";
           this.category = "success";
-          this.fetchAppointments();
+          if (!this.unsubscribe.live()) this.fetchAppointments();
         } else {
           this.message = data.message || "Failed to mark appointment.";
           this.category = "danger";
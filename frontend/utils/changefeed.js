@@ -0,0 +1,45 @@
+// Live deltas from /changes/stream (Server-Sent Events).
+// The browser reconnects on its own and resumes via Last-Event-ID,
+// so pages only fetch their lists once and then apply changes in place.
+// The returned unsubscribe function has live(): while it is false (no
+// EventSource, or the stream was refused or dropped for good) pages should
+// refetch after their own actions; onStale fires when the stream gives up.
+
+export function subscribeChanges(onChange, onStale = () => {}) {
+  const token = localStorage.getItem("token");
+  if (!token || !window.EventSource) {
+    const noop = () => {};
+    noop.live = () => false;
+    return noop;
+  }
+
+  const source = new EventSource(
+    `${location.origin}/changes/stream?jwt=${encodeURIComponent(token)}`
+  );
+  source.addEventListener("change", (event) => {
+    try {
+      onChange(JSON.parse(event.data));
+    } catch (err) {
+      console.error("Bad change event:", err);
+    }
+  });
+  source.addEventListener("error", () => {
+    // CONNECTING means the browser is retrying; CLOSED (e.g. a 503) is final
+    if (source.readyState === EventSource.CLOSED) onStale();
+  });
+  const unsubscribe = () => source.close();
+  unsubscribe.live = () => source.readyState === EventSource.OPEN;
+  return unsubscribe;
+}
+
+// Upsert or remove one row of `list` (matched on `key`) from a change event.
+export function applyChange(list, change, key = "id") {
+  const index = list.findIndex((row) => row[key] === change.entity_id);
+  if (change.action === "delete") {
+    if (index >= 0) list.splice(index, 1);
+  } else if (index >= 0) {
+    list.splice(index, 1, { ...list[index], ...change.data });
+  } else {
+    list.push(change.data);
+  }
+}
@@ -0,0 +1,36 @@
+// POST with an Idempotency-Key that stays the same across retries, so a
+// request that timed out on flaky Wi-Fi is replayed by the server instead of
+// being run twice. Retries on network errors, 503 (load shed) and 409 with
+// Retry-After (the first attempt is still running).
+
+export async function fetchIdempotent(url, options = {}, retries = 3) {
+  const key = newKey();
+  const headers = { ...(options.headers || {}), "Idempotency-Key": key };
+
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const res = await fetch(url, { ...options, headers });
+      const retryAfter = res.headers.get("Retry-After");
+      const retryable = res.status === 503 || (res.status === 409 && retryAfter);
+      if (!retryable || attempt >= retries) return res;
+      await sleep(1000 * (Number(retryAfter) || 1));
+    } catch (err) {
+      if (attempt >= retries) throw err;
+      await sleep(1000 * 2 ** attempt);
+    }
+  }
+}
+
+// crypto.randomUUID only exists on secure (https/localhost) pages
+function newKey() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  if (window.crypto && crypto.getRandomValues) {
+    const bytes = crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, (b) => b.toString(16).padStart(2, "0")).join("");
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+}
+
+function sleep(ms) {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}